@@ -1,18 +1,25 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+import contextvars
 import logging
 import os
-import requests
-import json
-import random
-import PyPDF2
-import re
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from database import init_db, clear_questions, store_questions, get_all_questions_by_unit
+from concurrent.futures import ThreadPoolExecutor
+from database import init_db, replace_questions, get_all_questions_by_unit, get_generation_stats
+from question_pipeline import extract_text_from_pdf, extract_units_from_text
+from ollama_client import OllamaError, summarize_generation_stats
+from token_budget import describe_plan
+from unit_revisions import revise_unit_questions
+from paper_batch import generate_paper_batch, max_pairwise_overlap
+from pdf_renderer import get_render_pool, submit_render_batch, wait_for_render_batch, render_batch_status
+from artifacts import new_job, job_dir, is_valid_job_id, upload_path
+from logging_setup import configure_logging
+from metrics import time_stage, render_metrics, CONTENT_TYPE
+from request_trace import begin_trace, finish_trace
+
+logger = logging.getLogger(__name__)
+
+configure_logging()
 
 app = Flask(__name__)
 CORS(app)
@@ -21,56 +28,27 @@ UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# System prompt for AI model
-SYSTEM_PROMPT = (
-    "As an AI assistant, your task is to generate exam questions from the provided text. "
-    "For each unit listed in the 'Units' section below, you must generate exactly 6 questions: "
-    "3 four-mark questions and 3 six-mark questions. "
-    "Do not generate more or fewer questions for any unit. "
-    "Each question should be relevant to the corresponding unit and cover key concepts. "
-    "Use the following strict format for each unit and question:\n\n"
-    "Unit X:\n"
-    "1. Question text [CO:X] [BT:Y] (4 marks).\n"
-    "2. Question text [CO:X] [BT:Y] (4 marks).\n"
-    "3. Question text [CO:X] [BT:Y] (4 marks).\n"
-    "4. Question text [CO:X] [BT:Y] (6 marks).\n"
-    "5. Question text [CO:X] [BT:Y] (6 marks).\n"
-    "6. Question text [CO:X] [BT:Y] (6 marks).\n\n"
-    "Important Guidelines:\n"
-    "- **CO Number Must Match Unit Number:** For each question, the [CO:X] must be the same as the unit number. For example, questions in Unit 1 must have [CO:1].\n"
-    "- **Single CO Number:** Only a single CO number is allowed. Do not include multiple CO numbers or ranges.\n"
-    "- **Bloom's Taxonomy (BT):** The [BT:Y] should be a Bloom's Taxonomy level between 1 and 6, appropriate for the question.\n"
-    "- **Exact Format:** Use square brackets '[ ]' and colons ':' exactly as shown in the format.\n"
-    "- **No Additional Text:** Do not include any additional text, notes, or disclaimers other than what is specified in the format.\n"
-    "- **No Introductions or Conclusions:** Do not add introductions, explanations, or any text before or after the units and questions.\n"
-    "- **Correct Numbering and Marks:** Ensure that each question is numbered correctly and corresponds to the marks indicated.\n"
-    "- **Use Provided Units:** The 'Units' section contains the unit numbers and titles. Use them as provided.\n"
-    "- **Do Not Omit Anything:** Do not omit any units or questions.\n"
-    "- **Strict Adherence:** Adhere strictly to the format and guidelines without deviation.\n"
-    "- **Non-Compliance:** If you cannot comply with these instructions, do not generate any output."
-)
-
-# Function: Extract Text from PDF
-def extract_text_from_pdf(filepath):
-    try:
-        text = ''
-        with open(filepath, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + '\n'
-        return text
-    except Exception as e:
-        logging.exception("Failed to extract text from PDF.")
-        raise
-
-# Function: Extract Units from Text
-def extract_units_from_text(syllabus_text):
-    units = {}
-    for line in syllabus_text.splitlines():
-        if re.match(r'^Unit\s+\d+.*', line, re.IGNORECASE):
-            unit_number = line.split(':')[0].strip()
-            units[unit_number] = line.strip()
-    return units
+# Paper batch defaults (override with ?count=N&max_overlap=M on /generate-papers)
+DEFAULT_NUM_PAPERS = 3
+DEFAULT_MAX_OVERLAP = 2
+
+# Multi-file uploads: files accepted per request, and generations run at once across requests
+MAX_UPLOAD_FILES = int(os.environ.get('QP_MAX_UPLOAD_FILES', 20))
+UPLOAD_LLM_WORKERS = int(os.environ.get('QP_UPLOAD_LLM_WORKERS', 4))
+
+# Endpoints answered with a Server-Timing header and a trace log record
+TRACED_ENDPOINTS = {'generate_questions', 'generate_questions_batch', 'generate_papers'}
+
+_generation_pool = None
+
+@app.before_request
+def start_request_trace():
+    if request.endpoint in TRACED_ENDPOINTS:
+        begin_trace(request.headers.get('X-Request-Id'))
+
+@app.after_request
+def finish_request_trace(response):
+    return finish_trace(response, request.method, request.path)
 
 @app.route('/')
 def index():
@@ -84,8 +62,9 @@ def generate_questions():
             return jsonify({'error': 'No syllabus file uploaded.'}), 400
 
         filename = secure_filename(syllabus_file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        syllabus_file.save(filepath)
+        filepath = upload_path(app.config['UPLOAD_FOLDER'], filename)
+        with time_stage('upload_save'):
+            syllabus_file.save(filepath)
 
         syllabus_text = extract_text_from_pdf(filepath)
         units = extract_units_from_text(syllabus_text)
@@ -93,37 +72,208 @@ def generate_questions():
         if not units:
             return jsonify({'error': 'No units found in the syllabus text.'}), 400
 
-        units_text = '\n'.join(units.keys())
-        prompt = f"{SYSTEM_PROMPT}\n\nUnits:\n{units_text}\n\nText:\n{syllabus_text}"
+        try:
+            # Units whose section is unchanged since the last upload keep their questions
+            revision = revise_unit_questions(units, syllabus_text, syllabus=filename)
+        except OllamaError as e:
+            logger.error("Generation failed: %s", e)
+            return jsonify({'error': 'Failed to generate questions from AI API.'}), 500
+        except ValueError as e:
+            # Empty output or units still missing questions, on the last model of the route
+            return jsonify({'error': str(e)}), 500
 
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={"model": "llama3.2-vision", "prompt": prompt},
-            stream=True
-        )
+        replace_questions(revision.unit_questions, sources=revision.sources, keep_units=revision.unchanged)
 
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to generate questions from AI API.'}), 500
+        return jsonify({
+            "message": "Questions generated and stored successfully.",
+            "units": list(units.values()),
+            "regenerated_units": list(revision.unit_questions.keys()),
+            "unchanged_units": revision.unchanged,
+            "plans": [describe_plan(plan) for plan in revision.plans],
+        }), 200
+    except Exception as e:
+        logger.exception("Error occurred in generating questions.")
+        return jsonify({'error': 'An error occurred.'}), 500
+
+# Function: Shared Thread Pool for Generations of Multi-file Uploads
+def get_generation_pool():
+    global _generation_pool
+    if _generation_pool is None:
+        _generation_pool = ThreadPoolExecutor(max_workers=UPLOAD_LLM_WORKERS)
+    return _generation_pool
 
-        generated_text = ''
-        for line in response.iter_lines():
-            if line:
-                json_line = json.loads(line)
-                if 'response' in json_line:
-                    generated_text += json_line['response']
+# Function: Generate and Store the Questions of One Syllabus
+def generate_for_syllabus(filename, syllabus_text, reference_text):
+    units = extract_units_from_text(syllabus_text)
+    if not units:
+        raise ValueError("No units found in the syllabus text.")
+    try:
+        revision = revise_unit_questions(units, syllabus_text, filename, reference_text, syllabus=filename)
+    except OllamaError as e:
+        logger.error("Generation for %s failed: %s", filename, e)
+        raise ValueError("Failed to generate questions from AI API.")
+    replace_questions(revision.unit_questions, syllabus=filename, sources=revision.sources,
+                      keep_units=revision.unchanged)
+    return revision
+
+# Route: Generate Questions for Several Syllabi in One Request
+@app.route('/generate-questions/batch', methods=['POST'])
+def generate_questions_batch():
+    """
+    Accept several `syllabus` files plus optional `reference` files. All PDFs are parsed
+    in parallel in the render pool; each syllabus is then generated concurrently (with the
+    reference text as extra context) and replaces only its own questions in the bank.
+    """
+    try:
+        syllabus_files = request.files.getlist('syllabus')
+        reference_files = request.files.getlist('reference')
+        if not syllabus_files:
+            return jsonify({'error': 'No syllabus file uploaded.'}), 400
+        if len(syllabus_files) + len(reference_files) > MAX_UPLOAD_FILES:
+            return jsonify({'error': f'At most {MAX_UPLOAD_FILES} files can be uploaded at once.'}), 400
 
-        if not generated_text.strip():
-            return jsonify({'error': 'No questions received from AI API.'}), 500
+        uploads = []
+        with time_stage('upload_save'):
+            for kind, files in (('syllabus', syllabus_files), ('reference', reference_files)):
+                for file in files:
+                    filename = secure_filename(file.filename)
+                    filepath = upload_path(app.config['UPLOAD_FOLDER'], filename)
+                    file.save(filepath)
+                    uploads.append((kind, filename, filepath))
 
-        # Parse and store questions (omitted for brevity but should use your existing logic)
-        # clear_questions()
-        # store_questions(parsed_questions)
+        with time_stage('extract_text'):
+            text_futures = [get_render_pool().submit(extract_text_from_pdf, filepath) for _, _, filepath in uploads]
+            texts = []
+            for future in text_futures:
+                try:
+                    texts.append((future.result(), None))
+                except Exception as e:
+                    texts.append((None, f"Could not read the PDF: {e}"))
 
-        return jsonify({"message": "Questions generated successfully."}), 200
+        references = []
+        reference_texts = []
+        for (kind, filename, _), (text, error) in zip(uploads, texts):
+            if kind != 'reference':
+                continue
+            if error:
+                references.append({'file': filename, 'status': 'failed', 'error': error})
+            else:
+                references.append({'file': filename, 'status': 'done'})
+                reference_texts.append(text)
+        reference_text = '\n'.join(reference_texts)
+
+        # Each generation runs in a copy of this request's context so its stages join the trace
+        results = []
+        generation_futures = []
+        for (kind, filename, _), (text, error) in zip(uploads, texts):
+            if kind != 'syllabus':
+                continue
+            result = {'file': filename}
+            results.append(result)
+            if error:
+                result.update(status='failed', error=error)
+                continue
+            context = contextvars.copy_context()
+            generation_futures.append((result, get_generation_pool().submit(
+                context.run, generate_for_syllabus, filename, text, reference_text
+            )))
+
+        for result, future in generation_futures:
+            try:
+                revision = future.result()
+                result.update(status='done', units=list(revision.unit_questions.keys()),
+                              unchanged_units=revision.unchanged,
+                              questions=sum(len(q) for marks in revision.unit_questions.values() for q in marks.values()))
+            except ValueError as e:
+                result.update(status='failed', error=str(e))
+            except Exception:
+                logger.exception("Error occurred in generating questions for %s.", result['file'])
+                result.update(status='failed', error='An error occurred.')
+
+        done = sum(1 for result in results if result['status'] == 'done')
+        return jsonify({
+            "message": f"Questions generated and stored for {done} of {len(results)} syllabi.",
+            "results": results,
+            "references": references,
+        }), 200 if done else 500
     except Exception as e:
-        logging.exception("Error occurred in generating questions.")
+        logger.exception("Error occurred in generating questions for a multi-file upload.")
         return jsonify({'error': 'An error occurred.'}), 500
 
+# Route: Generate Question Papers
+@app.route('/generate-papers', methods=['GET'])
+def generate_papers():
+    try:
+        logger.info("Received request to generate question papers.")
+        num_papers = request.args.get('count', DEFAULT_NUM_PAPERS, type=int)
+        max_overlap = request.args.get('max_overlap', DEFAULT_MAX_OVERLAP, type=int)
+        seed = request.args.get('seed', None, type=int)
+        # Papers come from one syllabus's bank (?syllabus=<file> for a multi-file upload)
+        syllabus = request.args.get('syllabus')
+
+        unit_questions = get_all_questions_by_unit(syllabus)
+        if not unit_questions:
+            if syllabus:
+                return jsonify({'error': f"No questions found for syllabus '{syllabus}'."}), 400
+            return jsonify({'error': 'No questions found. Generate questions first.'}), 400
+
+        try:
+            with time_stage('select_questions'):
+                papers_questions = generate_paper_batch(unit_questions, num_papers, max_overlap, seed=seed)
+        except ValueError as e:
+            logger.error("Could not build question papers: %s", e)
+            return jsonify({'error': str(e)}), 400
+
+        logger.info("Built %s papers, max shared questions: %s", len(papers_questions), max_pairwise_overlap(papers_questions))
+
+        # Render in the process pool and answer once the first papers are on disk;
+        # ?wait=all keeps the old behaviour of waiting for the whole batch
+        job_id = new_job()
+        batch_id = submit_render_batch(papers_questions, job_dir(job_id), batch_id=job_id)
+        min_ready = None if request.args.get('wait') == 'all' else 1
+        with time_stage('render_wait'):
+            status = wait_for_render_batch(batch_id, min_ready=min_ready)
+        logger.info("Batch %s: %s ready, %s pending.", batch_id, len(status['papers']), len(status['pending']))
+
+        return jsonify({"message": "Question papers generated successfully.", **status}), 200
+    except Exception as e:
+        logger.exception("An error occurred while generating question papers.")
+        return jsonify({'error': 'An error occurred while generating question papers.'}), 500
+
+# Route: Progress of a Paper Batch
+@app.route('/paper-batches/<batch_id>', methods=['GET'])
+def paper_batch_status(batch_id):
+    # Read from the job directory, so polls may land on any worker
+    status = render_batch_status(job_dir(batch_id)) if is_valid_job_id(batch_id) else None
+    if status is None:
+        return jsonify({'error': 'Unknown paper batch.'}), 404
+    return jsonify(status), 200
+
+# Route: Ollama Throughput Statistics
+@app.route('/generation-stats', methods=['GET'])
+def generation_stats():
+    rows = get_generation_stats(
+        model=request.args.get('model'), syllabus=request.args.get('syllabus'), unit=request.args.get('unit')
+    )
+    return jsonify(summarize_generation_stats(rows)), 200
+
+# Route: Prometheus Metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+# Route: Download Generated PDFs
+@app.route('/download/<job_id>/<filename>', methods=['GET'])
+def download_file(job_id, filename):
+    if not is_valid_job_id(job_id):
+        return jsonify({'error': 'File not found.'}), 404
+    try:
+        return send_from_directory(job_dir(job_id), filename, as_attachment=True)
+    except Exception as e:
+        logger.exception("An error occurred while trying to download the file: %s/%s", job_id, filename)
+        return jsonify({'error': 'File not found or an error occurred while downloading.'}), 404
+
 if __name__ == '__main__':
     init_db()
-    app.run(debug=True)
+    # Development server only; use serve.py for multi-worker deployments
+    app.run(debug=os.environ.get('QP_DEBUG') == '1')
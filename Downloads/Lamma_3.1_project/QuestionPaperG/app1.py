@@ -1,82 +1,45 @@
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, Response, jsonify, request, render_template, send_from_directory, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from database import init_db, clear_questions, get_all_questions_by_unit, store_questions
+from database import init_db, get_all_questions_by_unit, replace_questions
+from pdf_cache import selection_key, render_with_cache, get_cached_pdf, store_cached_pdf
+from pdf_renderer import split_question_tags, generate_custom_pdf as generate_pdf
+from logging_setup import configure_logging
+from artifacts import new_job, artifact_path, job_dir, is_valid_job_id, write_artifact, upload_path
+from metrics import time_stage, render_metrics, CONTENT_TYPE
+from request_trace import begin_trace, finish_trace
+from question_pipeline import extract_text_from_pdf, extract_units_from_text, select_questions
+from unit_revisions import revise_unit_questions
+from ollama_client import OllamaError
+import io
 import logging
 import os
-import random
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-import PyPDF2
-import requests
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
 
 # Logging Configuration
-logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+configure_logging()
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
-OLLAMA_URL = "http://localhost:11434/api/generate"  # Ollama API endpoint
+# Endpoints answered with a Server-Timing header and a trace log record
+TRACED_ENDPOINTS = {"generate_questions", "generate_question_paper"}
 
-# Utility Function: Extract Text from PDF
-def extract_text_from_pdf(filepath):
-    """
-    Extract text from a PDF file.
-    """
-    try:
-        logging.debug(f"Extracting text from PDF: {filepath}")
-        text = ""
-        with open(filepath, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        logging.debug("Text extraction complete.")
-        return text
-    except Exception as e:
-        logging.exception("Failed to extract text from PDF.")
-        raise
 
+@app.before_request
+def start_request_trace():
+    if request.endpoint in TRACED_ENDPOINTS:
+        begin_trace(request.headers.get("X-Request-Id"))
 
-# Utility Function: Generate PDF
-def generate_pdf(unit_questions, filepath):
-    try:
-        logging.debug("Generating PDF for question paper.")
-        doc = SimpleDocTemplate(filepath, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = []
-
-        # Add title
-        title = Paragraph("Custom Question Paper", styles["Heading1"])
-        elements.append(title)
-        elements.append(Spacer(1, 12))
-
-        # Add table for questions
-        table_data = [["Unit", "Marks", "Question"]]
-        for unit, questions in unit_questions.items():
-            for question in questions:
-                table_data.append([unit, question["marks"], question["text"]])
-
-        table = Table(table_data, colWidths=[100, 50, 300])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-        doc.build(elements)
-        logging.debug(f"PDF generated successfully: {filepath}")
-    except Exception as e:
-        logging.exception("Failed to generate PDF.")
-        raise
+
+@app.after_request
+def finish_request_trace(response):
+    return finish_trace(response, request.method, request.path)
 
 
 @app.route('/')
@@ -96,47 +59,61 @@ def generate_questions():
 
         # Save the uploaded syllabus PDF
         filename = secure_filename(syllabus_file.filename)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        syllabus_file.save(filepath)
+        filepath = upload_path(app.config["UPLOAD_FOLDER"], filename)
+        with time_stage("upload_save"):
+            syllabus_file.save(filepath)
 
         # Extract text from the syllabus PDF
         syllabus_text = extract_text_from_pdf(filepath)
 
-        # Send the syllabus text to Ollama to generate questions
-        logging.debug("Sending syllabus text to Ollama for question generation.")
-        response = requests.post(
-            OLLAMA_URL,
-            json={"model": "llama3.2-vision", "prompt": f"Generate questions from the syllabus:\n\n{syllabus_text}"},
-            stream=True
-        )
+        units = extract_units_from_text(syllabus_text)
+        if not units:
+            return jsonify({"error": "No units found in the syllabus text."}), 400
 
-        if response.status_code != 200:
-            logging.error(f"Ollama API returned error: {response.status_code}")
+        # Generate the questions of new and changed units as schema-constrained JSON on the routed models
+        logger.debug("Sending syllabus text to Ollama for question generation.")
+        try:
+            revision = revise_unit_questions(units, syllabus_text, syllabus=filename)
+        except OllamaError as e:
+            logger.error("Ollama generation failed: %s", e)
             return jsonify({"error": "Failed to generate questions using Ollama."}), 500
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 500
 
-        # Collect questions from Ollama's response
-        generated_questions = {}
-        for line in response.iter_lines():
-            if line:
-                json_line = line.decode('utf-8')
-                question_data = eval(json_line)
-                unit = question_data.get("unit")
-                question_text = question_data.get("text")
-                marks = question_data.get("marks")
+        # Store questions in the database
+        logger.debug("Replacing the question bank with the generated questions.")
+        replace_questions(revision.unit_questions, sources=revision.sources, keep_units=revision.unchanged)
 
-                if unit not in generated_questions:
-                    generated_questions[unit] = {"4": [], "6": []}
+        # The unit headings are the bank's keys; index2 sends them back in paper specs
+        return jsonify({"message": "Questions generated and stored successfully.",
+                        "units": list(units.values())}), 200
+    except Exception as e:
+        logger.exception("Error in generating and storing questions.")
+        return jsonify({"error": "An error occurred while processing the request."}), 500
 
-                generated_questions[unit][str(marks)].append({"text": question_text, "marks": marks})
 
-        # Store questions in the database
-        logging.debug("Clearing and storing generated questions in the database.")
-        clear_questions()
-        store_questions(generated_questions)
+@app.route("/preview-qp", methods=["POST"])
+def preview_question_paper():
+    """
+    Render the selected questions as an HTML table so the spec can be checked
+    before paying for the PDF build.
+    """
+    try:
+        data = request.json
+        unit_questions, error = select_questions(data, get_all_questions_by_unit(data.get("syllabus")))
+        if error:
+            return jsonify({"error": error}), 400
+
+        rows = []
+        for unit, questions in unit_questions.items():
+            for question in questions:
+                text, co, bt = split_question_tags(question["text"])
+                rows.append({"unit": unit, "marks": question["marks"], "co": co, "bt": bt, "text": text})
 
-        return jsonify({"message": "Questions generated and stored successfully."}), 200
+        return render_template("preview_qp.html", rows=rows,
+                               total_marks=sum(int(row["marks"]) for row in rows))
     except Exception as e:
-        logging.exception("Error in generating and storing questions.")
+        logger.exception("Error in question paper preview.")
         return jsonify({"error": "An error occurred while processing the request."}), 500
 
 
@@ -147,67 +124,84 @@ def generate_question_paper():
     """
     try:
         data = request.json
+        unit_questions, error = select_questions(data, get_all_questions_by_unit(data.get("syllabus")))
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Input Validation
-        total_marks = data.get("total_marks")
-        unit_details = data.get("unit_details", [])
-
-        if not total_marks or not unit_details:
-            return jsonify({"error": "Total marks and unit details are required."}), 400
-
-        # Validate that marks match the total
-        calculated_marks = sum(
-            sum(q_count * int(q_marks) for q_marks, q_count in unit["questions"].items())
-            for unit in unit_details
-        )
-        if calculated_marks != total_marks:
-            return jsonify({"error": f"Total marks mismatch. Expected {total_marks}, got {calculated_marks}"}), 400
-
-        # Fetch questions from the database
-        all_questions = get_all_questions_by_unit()
-        unit_questions = {}
-
-        for unit in unit_details:
-            unit_name = unit["unit"]
-            questions = []
-            for q_marks, q_count in unit["questions"].items():
-                q_marks_str = str(q_marks)
-                if q_marks_str in all_questions[unit_name] and len(all_questions[unit_name][q_marks_str]) >= q_count:
-                    selected_questions = all_questions[unit_name][q_marks_str][:q_count]
-                    questions.extend(selected_questions)
-                else:
-                    return jsonify({
-                        "error": f"Not enough questions for {q_marks}-mark in Unit {unit_name}. Requested {q_count}."
-                    }), 400
-
-            unit_questions[unit_name] = questions
-
-        # Generate PDF
         pdf_filename = "custom_question_paper.pdf"
-        pdf_filepath = os.path.join(UPLOAD_FOLDER, pdf_filename)
-        generate_pdf(unit_questions, pdf_filepath)
+        cache_key = selection_key(unit_questions, "custom-table", {"title": "Custom Question Paper"})
+
+        # Inline mode: build the PDF in memory and return it in this response
+        if data.get("inline"):
+            return stream_question_paper(unit_questions, cache_key, pdf_filename, persist=data.get("persist", False))
+
+        # Generate PDF (repeat selections are served from the render cache)
+        job_id = new_job()
+        pdf_filepath = artifact_path(job_id, pdf_filename)
+        cache_hit = render_with_cache(cache_key, lambda path: generate_pdf(unit_questions, path), pdf_filepath)
+        logger.debug("Question paper %s: %s", 'reused from cache' if cache_hit else 'rendered', cache_key)
 
         return jsonify({
             "message": "Question paper generated successfully.",
-            "download_url": f"/download/{pdf_filename}"
+            "download_url": f"/download/{job_id}/{pdf_filename}"
         })
     except Exception as e:
-        logging.exception("Error in question paper generation.")
+        logger.exception("Error in question paper generation.")
         return jsonify({"error": "An error occurred while processing the request."}), 500
 
 
-@app.route('/download/<filename>', methods=['GET'])
-def download_file(filename):
+def stream_question_paper(unit_questions, cache_key, pdf_filename, persist=False):
+    """
+    Send the question paper straight back as the response body. A cached render is sent
+    as-is; otherwise the PDF is built into a memory buffer and stored in the cache for the
+    next request. With `persist` a copy is also kept in a job directory for audit, and its
+    job id is returned in the X-Job-Id header.
+    """
+    cached_path = get_cached_pdf(cache_key)
+    if cached_path:
+        with open(cached_path, "rb") as file:
+            pdf_bytes = file.read()
+    else:
+        buffer = io.BytesIO()
+        generate_pdf(unit_questions, buffer)
+        pdf_bytes = buffer.getvalue()
+        store_cached_pdf(cache_key, pdf_bytes)
+
+    headers = {}
+    if persist:
+        job_id = new_job()
+        write_artifact(job_id, pdf_filename, pdf_bytes)
+        headers["X-Job-Id"] = job_id
+
+    response = send_file(io.BytesIO(pdf_bytes), mimetype="application/pdf",
+                         as_attachment=True, download_name=pdf_filename)
+    response.headers.update(headers)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Expose per-stage latency histograms in Prometheus text format.
+    """
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+@app.route('/download/<job_id>/<filename>', methods=['GET'])
+def download_file(job_id, filename):
     """
     Allow the user to download the generated question paper.
     """
+    if not is_valid_job_id(job_id):
+        return jsonify({'error': 'File not found.'}), 404
     try:
-        return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
+        return send_from_directory(job_dir(job_id), filename, as_attachment=True)
     except Exception as e:
-        logging.exception("Error occurred in file download.")
+        logger.exception("Error occurred in file download.")
         return jsonify({'error': 'File not found.'}), 404
 
 
 if __name__ == "__main__":
     init_db()
-    app.run(debug=True)
+    # Development server only; use serve.py for multi-worker deployments
+    app.run(debug=os.environ.get('QP_DEBUG') == '1')
@@ -0,0 +1,92 @@
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Generated papers live here, one directory per job, away from the syllabus uploads.
+# Absolute, because send_from_directory resolves relative paths against the app's root,
+# not the working directory the papers are written to
+OUTPUT_ROOT = os.path.abspath(os.environ.get('QP_OUTPUT_ROOT', 'outputs'))
+# Job directories older than this are removed when new jobs are created
+ARTIFACT_TTL_SECONDS = int(os.environ.get('QP_ARTIFACT_TTL_HOURS', 24)) * 3600
+PURGE_INTERVAL_SECONDS = 600
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+_last_purge = 0.0
+
+# Function: Start a New Job Namespace
+def new_job():
+    """
+    Create an empty output directory for a request or batch and return its job id.
+    """
+    purge_expired_jobs()
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_dir(job_id), exist_ok=True)
+    return job_id
+
+def is_valid_job_id(job_id):
+    return bool(JOB_ID_PATTERN.match(job_id or ''))
+
+def job_dir(job_id):
+    if not is_valid_job_id(job_id):
+        raise ValueError(f"Invalid job id: {job_id}")
+    return os.path.join(OUTPUT_ROOT, job_id)
+
+# Function: Collision-free Path for an Uploaded File
+def upload_path(upload_folder, filename):
+    """
+    Prefix the (already secured) name so concurrent uploads of the same file never share a path.
+    """
+    return os.path.join(upload_folder, f"{uuid.uuid4().hex[:12]}_{filename}")
+
+# Function: Final Path of an Artifact
+def artifact_path(job_id, filename):
+    return os.path.join(job_dir(job_id), filename)
+
+# Function: Unique Staging Path Next to the Final Artifact
+def staging_path(filepath):
+    """
+    Return a temporary name in the same directory as `filepath` (so the final rename stays
+    atomic) that no other thread or process will pick.
+    """
+    return f"{filepath}.{uuid.uuid4().hex}.part"
+
+# Function: Publish a Staged File
+def commit_artifact(staged_filepath, filepath):
+    os.replace(staged_filepath, filepath)
+
+# Function: Write Bytes as an Artifact
+def write_artifact(job_id, filename, data):
+    filepath = artifact_path(job_id, filename)
+    staged_filepath = staging_path(filepath)
+    with open(staged_filepath, 'wb') as file:
+        file.write(data)
+    commit_artifact(staged_filepath, filepath)
+    return filepath
+
+# Function: Remove Old Job Directories
+def purge_expired_jobs(ttl_seconds=None, force=False):
+    global _last_purge
+    now = time.time()
+    if not force and now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return 0
+    _last_purge = now
+    ttl_seconds = ARTIFACT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+
+    removed = 0
+    try:
+        with os.scandir(OUTPUT_ROOT) as it:
+            for entry in it:
+                if entry.is_dir() and is_valid_job_id(entry.name) and now - entry.stat().st_mtime > ttl_seconds:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+    except FileNotFoundError:
+        return 0
+    if removed:
+        logger.info("Removed %s expired job directories from %s.", removed, OUTPUT_ROOT)
+    return removed
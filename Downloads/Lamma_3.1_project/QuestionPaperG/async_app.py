@@ -0,0 +1,310 @@
+"""
+Async (ASGI) serving mode.
+
+Same endpoints as app.py/app1.py for question generation and paper building, but
+built on Quart so a long Ollama generation only holds an awaiting coroutine, not
+a worker. Ollama is streamed with httpx.AsyncClient, PDF parsing and reportlab run
+in the shared render process pool, and the bank is read/written with aiosqlite.
+
+Run with an ASGI server, e.g.:
+    hypercorn async_app:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import io
+import logging
+import os
+import httpx
+from quart import Quart, Response, request, jsonify, render_template, send_from_directory, send_file
+from quart_cors import cors
+from werkzeug.utils import secure_filename
+import async_database
+from database import init_db, get_generation_stats
+from question_pipeline import extract_text_from_pdf, extract_units_from_text, select_questions
+from pdf_cache import selection_key, get_cached_pdf, store_cached_pdf
+from pdf_renderer import get_render_pool, render_custom_pdf_bytes, split_question_tags
+from artifacts import new_job, job_dir, is_valid_job_id, write_artifact, upload_path
+from logging_setup import configure_logging
+from ollama_client import OllamaError, summarize_generation_stats, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT
+from token_budget import describe_plan
+from unit_revisions import arevise_unit_questions
+from metrics import time_stage, render_metrics, CONTENT_TYPE
+from request_trace import begin_trace, finish_trace
+
+logger = logging.getLogger(__name__)
+
+configure_logging()
+
+app = cors(Quart(__name__))
+
+UPLOAD_FOLDER = 'uploads'
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+# Concurrent connections to Ollama shared by all in-flight generations
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get('QP_OLLAMA_MAX_CONNECTIONS', 100))
+# Generations can take minutes in total; connecting and each wait for the next chunk are bounded
+OLLAMA_TIMEOUT = httpx.Timeout(None, connect=OLLAMA_CONNECT_TIMEOUT, read=OLLAMA_READ_TIMEOUT)
+# Files accepted by one multi-file upload
+MAX_UPLOAD_FILES = int(os.environ.get('QP_MAX_UPLOAD_FILES', 20))
+
+http_client = None
+
+# Endpoints answered with a Server-Timing header and a trace log record
+TRACED_ENDPOINTS = {'generate_questions', 'generate_questions_batch', 'generate_question_paper'}
+
+@app.before_serving
+async def startup():
+    global http_client
+    init_db()
+    http_client = httpx.AsyncClient(
+        timeout=OLLAMA_TIMEOUT,
+        limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS)
+    )
+
+@app.after_serving
+async def shutdown():
+    await http_client.aclose()
+
+# Function: Run CPU-bound Work in the Process Pool
+async def run_in_pool(stage, func, *args):
+    """
+    Stage timers inside the worker process are not visible here, so the call is timed
+    from the event loop instead.
+    """
+    with time_stage(stage):
+        return await asyncio.get_running_loop().run_in_executor(get_render_pool(), func, *args)
+
+# Hooks are coroutines so the trace is set in the request's own task context
+@app.before_request
+async def start_request_trace():
+    if request.endpoint in TRACED_ENDPOINTS:
+        begin_trace(request.headers.get('X-Request-Id'))
+
+@app.after_request
+async def finish_request_trace(response):
+    return finish_trace(response, request.method, request.path)
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/generate-questions', methods=['POST'])
+async def generate_questions():
+    try:
+        files = await request.files
+        syllabus_file = files.get('syllabus', None)
+        if not syllabus_file:
+            return jsonify({'error': 'No syllabus file uploaded.'}), 400
+
+        filename = secure_filename(syllabus_file.filename)
+        filepath = upload_path(app.config['UPLOAD_FOLDER'], filename)
+        with time_stage('upload_save'):
+            await syllabus_file.save(filepath)
+
+        syllabus_text = await run_in_pool('extract_text', extract_text_from_pdf, filepath)
+        units = extract_units_from_text(syllabus_text)
+
+        if not units:
+            return jsonify({'error': 'No units found in the syllabus text.'}), 400
+
+        try:
+            revision = await arevise_unit_questions(http_client, units, syllabus_text, syllabus=filename)
+        except OllamaError as e:
+            logger.error("Generation failed: %s", e)
+            return jsonify({'error': 'Failed to generate questions from AI API.'}), 500
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 500
+
+        await async_database.replace_questions(revision.unit_questions, sources=revision.sources,
+                                               keep_units=revision.unchanged)
+
+        return jsonify({
+            "message": "Questions generated and stored successfully.",
+            "units": list(units.values()),
+            "regenerated_units": list(revision.unit_questions.keys()),
+            "unchanged_units": revision.unchanged,
+            "plans": [describe_plan(plan) for plan in revision.plans],
+        }), 200
+    except Exception as e:
+        logger.exception("Error occurred in generating questions.")
+        return jsonify({'error': 'An error occurred.'}), 500
+
+# Function: Generate and Store the Questions of One Syllabus
+async def generate_for_syllabus(filename, syllabus_text, reference_text):
+    units = extract_units_from_text(syllabus_text)
+    if not units:
+        raise ValueError("No units found in the syllabus text.")
+    try:
+        revision = await arevise_unit_questions(http_client, units, syllabus_text, filename, reference_text,
+                                                syllabus=filename)
+    except OllamaError as e:
+        logger.error("Generation for %s failed: %s", filename, e)
+        raise ValueError("Failed to generate questions from AI API.")
+    await async_database.replace_questions(revision.unit_questions, syllabus=filename, sources=revision.sources,
+                                           keep_units=revision.unchanged)
+    return revision
+
+@app.route('/generate-questions/batch', methods=['POST'])
+async def generate_questions_batch():
+    """
+    Several `syllabus` files plus optional `reference` files in one request: all PDFs are
+    parsed in parallel, then every syllabus is generated concurrently over the shared
+    Ollama connection pool and replaces only its own questions in the bank.
+    """
+    try:
+        files = await request.files
+        syllabus_files = files.getlist('syllabus')
+        reference_files = files.getlist('reference')
+        if not syllabus_files:
+            return jsonify({'error': 'No syllabus file uploaded.'}), 400
+        if len(syllabus_files) + len(reference_files) > MAX_UPLOAD_FILES:
+            return jsonify({'error': f'At most {MAX_UPLOAD_FILES} files can be uploaded at once.'}), 400
+
+        uploads = []
+        with time_stage('upload_save'):
+            for kind, kind_files in (('syllabus', syllabus_files), ('reference', reference_files)):
+                for file in kind_files:
+                    filename = secure_filename(file.filename)
+                    filepath = upload_path(app.config['UPLOAD_FOLDER'], filename)
+                    await file.save(filepath)
+                    uploads.append((kind, filename, filepath))
+
+        texts = await asyncio.gather(
+            *(run_in_pool('extract_text', extract_text_from_pdf, filepath) for _, _, filepath in uploads),
+            return_exceptions=True
+        )
+
+        references = []
+        reference_texts = []
+        for (kind, filename, _), text in zip(uploads, texts):
+            if kind != 'reference':
+                continue
+            if isinstance(text, Exception):
+                references.append({'file': filename, 'status': 'failed', 'error': f"Could not read the PDF: {text}"})
+            else:
+                references.append({'file': filename, 'status': 'done'})
+                reference_texts.append(text)
+        reference_text = '\n'.join(reference_texts)
+
+        syllabi = [(filename, text) for (kind, filename, _), text in zip(uploads, texts) if kind == 'syllabus']
+        outcomes = await asyncio.gather(
+            *(generate_for_syllabus(filename, text, reference_text)
+              for filename, text in syllabi if not isinstance(text, Exception)),
+            return_exceptions=True
+        )
+
+        results = []
+        outcomes = iter(outcomes)
+        for filename, text in syllabi:
+            if isinstance(text, Exception):
+                results.append({'file': filename, 'status': 'failed', 'error': f"Could not read the PDF: {text}"})
+                continue
+            outcome = next(outcomes)
+            if isinstance(outcome, ValueError):
+                results.append({'file': filename, 'status': 'failed', 'error': str(outcome)})
+            elif isinstance(outcome, Exception):
+                logger.error("Error occurred in generating questions for %s: %r", filename, outcome)
+                results.append({'file': filename, 'status': 'failed', 'error': 'An error occurred.'})
+            else:
+                results.append({'file': filename, 'status': 'done', 'units': list(outcome.unit_questions.keys()),
+                                'unchanged_units': outcome.unchanged,
+                                'questions': sum(len(q) for marks in outcome.unit_questions.values() for q in marks.values())})
+
+        done = sum(1 for result in results if result['status'] == 'done')
+        return jsonify({
+            "message": f"Questions generated and stored for {done} of {len(results)} syllabi.",
+            "results": results,
+            "references": references,
+        }), 200 if done else 500
+    except Exception as e:
+        logger.exception("Error occurred in generating questions for a multi-file upload.")
+        return jsonify({'error': 'An error occurred.'}), 500
+
+@app.route('/preview-qp', methods=['POST'])
+async def preview_question_paper():
+    try:
+        data = await request.get_json()
+        unit_questions, error = select_questions(
+            data, await async_database.get_all_questions_by_unit(data.get("syllabus"))
+        )
+        if error:
+            return jsonify({"error": error}), 400
+
+        rows = []
+        for unit, questions in unit_questions.items():
+            for question in questions:
+                text, co, bt = split_question_tags(question["text"])
+                rows.append({"unit": unit, "marks": question["marks"], "co": co, "bt": bt, "text": text})
+
+        return await render_template("preview_qp.html", rows=rows,
+                                     total_marks=sum(int(row["marks"]) for row in rows))
+    except Exception as e:
+        logger.exception("Error in question paper preview.")
+        return jsonify({"error": "An error occurred while processing the request."}), 500
+
+def read_cached_pdf(cache_key):
+    cached_path = get_cached_pdf(cache_key)
+    if cached_path is None:
+        return None
+    with open(cached_path, "rb") as file:
+        return file.read()
+
+def save_paper(pdf_filename, pdf_bytes):
+    job_id = new_job()
+    write_artifact(job_id, pdf_filename, pdf_bytes)
+    return job_id
+
+@app.route('/generate-qp', methods=['POST'])
+async def generate_question_paper():
+    try:
+        data = await request.get_json()
+        unit_questions, error = select_questions(
+            data, await async_database.get_all_questions_by_unit(data.get("syllabus"))
+        )
+        if error:
+            return jsonify({"error": error}), 400
+
+        pdf_filename = "custom_question_paper.pdf"
+        cache_key = selection_key(unit_questions, "custom-table", {"title": "Custom Question Paper"})
+        # Disk I/O runs in threads so other requests keep being served meanwhile
+        pdf_bytes = await asyncio.to_thread(read_cached_pdf, cache_key)
+        if pdf_bytes is None:
+            pdf_bytes = await run_in_pool('generate_pdf', render_custom_pdf_bytes, unit_questions)
+            await asyncio.to_thread(store_cached_pdf, cache_key, pdf_bytes)
+
+        if data.get("inline"):
+            response = await send_file(io.BytesIO(pdf_bytes), mimetype="application/pdf",
+                                       as_attachment=True, attachment_filename=pdf_filename)
+            if data.get("persist"):
+                response.headers["X-Job-Id"] = await asyncio.to_thread(save_paper, pdf_filename, pdf_bytes)
+            return response
+
+        job_id = await asyncio.to_thread(save_paper, pdf_filename, pdf_bytes)
+        return jsonify({
+            "message": "Question paper generated successfully.",
+            "download_url": f"/download/{job_id}/{pdf_filename}"
+        })
+    except Exception as e:
+        logger.exception("Error in question paper generation.")
+        return jsonify({"error": "An error occurred while processing the request."}), 500
+
+@app.route('/generation-stats', methods=['GET'])
+async def generation_stats():
+    rows = await asyncio.to_thread(
+        get_generation_stats, request.args.get('model'), request.args.get('syllabus'), request.args.get('unit')
+    )
+    return jsonify(summarize_generation_stats(rows)), 200
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+@app.route('/download/<job_id>/<filename>', methods=['GET'])
+async def download_file(job_id, filename):
+    if not is_valid_job_id(job_id):
+        return jsonify({'error': 'File not found.'}), 404
+    try:
+        return await send_from_directory(job_dir(job_id), filename, as_attachment=True)
+    except Exception as e:
+        logger.exception("An error occurred while trying to download the file: %s/%s", job_id, filename)
+        return jsonify({'error': 'File not found or an error occurred while downloading.'}), 404
@@ -0,0 +1,64 @@
+import logging
+import aiosqlite
+from database import DATABASE, BANK_QUERY, REPLACED_SOURCES_QUERY, replaced_questions_query, unit_source_rows
+from metrics import time_stage, QUESTIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# Async counterparts of database.py for the ASGI app (same table, same return shapes)
+
+async def clear_questions():
+    async with aiosqlite.connect(DATABASE) as conn:
+        await conn.execute('DELETE FROM questions')
+        await conn.commit()
+    logger.info("Cleared all existing questions from the database.")
+
+async def store_questions(unit_questions):
+    rows = [
+        (unit, question_data['text'], int(mark))
+        for unit, marks_dict in unit_questions.items()
+        for mark, questions in marks_dict.items()
+        for question_data in questions
+    ]
+    with time_stage('store_questions'):
+        async with aiosqlite.connect(DATABASE) as conn:
+            await conn.executemany('INSERT INTO questions (unit, question, marks) VALUES (?, ?, ?)', rows)
+            await conn.commit()
+    QUESTIONS_TOTAL.inc('stored', amount=len(rows))
+    logger.info("Stored %s questions in the database.", len(rows))
+
+async def replace_questions(unit_questions, syllabus=None, sources=None, keep_units=()):
+    rows = [
+        (unit, question_data['text'], int(mark), syllabus)
+        for unit, marks_dict in unit_questions.items()
+        for mark, questions in marks_dict.items()
+        for question_data in questions
+    ]
+    with time_stage('store_questions'):
+        async with aiosqlite.connect(DATABASE) as conn:
+            await conn.execute(*replaced_questions_query(syllabus, keep_units))
+            await conn.executemany('INSERT INTO questions (unit, question, marks, syllabus) VALUES (?, ?, ?, ?)', rows)
+            if sources is not None:
+                await conn.execute(REPLACED_SOURCES_QUERY, (syllabus,))
+                await conn.executemany(
+                    'INSERT INTO unit_sources (syllabus, unit, section, content_hash, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    unit_source_rows(sources, syllabus)
+                )
+            await conn.commit()
+    QUESTIONS_TOTAL.inc('stored', amount=len(rows))
+    logger.info("Replaced the questions of %s (%s questions, %s units kept).",
+                syllabus or 'the web-upload bank', len(rows), len(keep_units))
+
+async def get_all_questions_by_unit(syllabus=None):
+    with time_stage('bank_read'):
+        async with aiosqlite.connect(DATABASE) as conn:
+            async with conn.execute(BANK_QUERY, (syllabus,)) as cursor:
+                questions = await cursor.fetchall()
+
+    unit_questions = {}
+    for question_id, unit, question, marks in questions:
+        if unit not in unit_questions:
+            unit_questions[unit] = {'4': [], '6': []}
+        question_data = {'id': question_id, 'text': question, 'marks': marks}
+        unit_questions[unit][str(marks)].append(question_data)
+    return unit_questions
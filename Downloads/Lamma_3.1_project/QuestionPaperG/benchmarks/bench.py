@@ -0,0 +1,213 @@
+"""
+Micro-benchmarks for the pure pipeline functions, on synthetic inputs at increasing scale.
+
+Run from the QuestionPaperG directory:
+
+    python -m benchmarks.bench run                              # all cases, all scales
+    python -m benchmarks.bench run --scales small -k parse      # a subset
+    python -m benchmarks.bench run -o benchmarks/baselines/main.json
+    python -m benchmarks.bench compare benchmarks/baselines/main.json current.json --threshold 10
+
+`run` saves a JSON baseline (per-call best/median/mean seconds for every case and scale).
+`compare` reports the change of each case against a baseline using the best time (the
+least noisy statistic) and exits with status 1 when any case is slower than the threshold.
+Baselines are only comparable when recorded on the same machine.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import database
+import question_pipeline
+import question_ranking
+import structured_output
+import pdf_renderer
+from benchmarks import synthetic
+
+# Scale name -> (units in the syllabus, questions per marks value per unit)
+SCALES = {
+    'small': (5, 3),
+    'medium': (25, 10),
+    'large': (100, 30),
+}
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 10.0
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# Each case takes (num_units, per_marks, workdir) and returns the callable to time
+def case_extract_text_from_pdf(num_units, per_marks, workdir):
+    filepath = os.path.join(workdir, f'syllabus_{num_units}.pdf')
+    synthetic.make_syllabus_pdf(filepath, num_units)
+    return lambda: question_pipeline.extract_text_from_pdf(filepath)
+
+def case_extract_units_from_text(num_units, per_marks, workdir):
+    # Clear the index cache so every call measures the full scan
+    text = synthetic.make_syllabus_text(num_units)
+    def run():
+        question_pipeline.get_unit_index.cache_clear()
+        question_pipeline.extract_units_from_text(text)
+    return run
+
+def case_decode_structured_output(num_units, per_marks, workdir):
+    # Fed in 4-character chunks, about the size of the tokens Ollama streams
+    text = synthetic.make_structured_output(num_units, per_marks)
+    chunks = [text[i:i + 4] for i in range(0, len(text), 4)]
+    units = synthetic.make_units(num_units)
+    counts = {'4': per_marks, '6': per_marks}
+    def run():
+        decoder = structured_output.UnitStreamDecoder()
+        for chunk in chunks:
+            decoder.feed(chunk)
+        structured_output.questions_from_units(decoder.units, units, counts)
+    return run
+
+def case_rank_unit_questions(num_units, per_marks, workdir):
+    # Every bucket holds per_marks candidates, all ranked. Ranking rebinds each unit's buckets
+    # in place, so every call ranks a fresh copy of the unranked bank's containers
+    unit_questions = synthetic.make_unit_questions(num_units, per_marks)
+    return lambda: question_ranking.rank_unit_questions(
+        {unit: dict(buckets) for unit, buckets in unit_questions.items()}
+    )
+
+def case_store_questions(num_units, per_marks, workdir):
+    # Clears first so every call inserts into an empty table
+    unit_questions = synthetic.make_unit_questions(num_units, per_marks)
+    def run():
+        database.clear_questions()
+        database.store_questions(unit_questions)
+    return run
+
+def case_get_all_questions_by_unit(num_units, per_marks, workdir):
+    database.clear_questions()
+    database.store_questions(synthetic.make_unit_questions(num_units, per_marks))
+    return database.get_all_questions_by_unit
+
+def case_generate_pdf(num_units, per_marks, workdir):
+    # One paper (a question per marks value per unit), rendered into memory
+    paper = synthetic.make_paper(synthetic.make_unit_questions(num_units, per_marks))
+    return lambda: pdf_renderer.generate_pdf(paper, io.BytesIO())
+
+CASES = {
+    name[len('case_'):]: func for name, func in globals().items() if name.startswith('case_')
+}
+
+# Function: Time One Callable
+def measure(func, repeat):
+    """
+    Pick a loop count that runs for at least 0.2s (timeit.autorange), then time
+    `repeat` such loops. Returns per-call seconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    per_call = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'number': number,
+        'best': min(per_call),
+        'median': statistics.median(per_call),
+        'mean': statistics.fmean(per_call),
+    }
+
+# Function: Run the Selected Cases at the Selected Scales
+def run_benchmarks(case_names, scale_names, repeat):
+    results = {}
+    # INFO lines from every call would drown the report
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the benchmark rows out of the real question bank
+        database.DATABASE = os.path.join(workdir, 'bench.db')
+        database.init_db()
+        for case_name in case_names:
+            for scale_name in scale_names:
+                num_units, per_marks = SCALES[scale_name]
+                func = CASES[case_name](num_units, per_marks, workdir)
+                key = f'{case_name}[{scale_name}]'
+                results[key] = measure(func, repeat)
+                print(f"{key:50} best {results[key]['best'] * 1000:10.3f} ms  "
+                      f"median {results[key]['median'] * 1000:10.3f} ms", flush=True)
+    return results
+
+# Function: Compare Two Result Sets
+def compare_results(baseline, current, threshold):
+    """
+    Return (rows, regressions) where each row is (key, baseline best, current best, % change).
+    """
+    rows = []
+    regressions = []
+    for key in sorted(set(baseline) & set(current)):
+        before, after = baseline[key]['best'], current[key]['best']
+        change = (after - before) / before * 100
+        rows.append((key, before, after, change))
+        if change > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+def load_results(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)['results']
+
+def cmd_run(args):
+    case_names = [name for name in CASES if not args.k or any(k in name for k in args.k)]
+    results = run_benchmarks(case_names, args.scales, args.repeat)
+    output = args.output or os.path.join(BASELINE_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({
+            'meta': {
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'scales': {name: SCALES[name] for name in args.scales},
+            },
+            'results': results,
+        }, file, indent=2)
+    print(f"Saved {len(results)} results to {output}")
+    if args.compare_to:
+        return report(load_results(args.compare_to), results, args.threshold)
+    return 0
+
+def cmd_compare(args):
+    return report(load_results(args.baseline), load_results(args.current), args.threshold)
+
+def report(baseline, current, threshold):
+    rows, regressions = compare_results(baseline, current, threshold)
+    for key, before, after, change in rows:
+        flag = '  REGRESSION' if key in regressions else ''
+        print(f"{key:50} {before * 1000:10.3f} ms -> {after * 1000:10.3f} ms  {change:+7.1f}%{flag}")
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the {threshold}% threshold.")
+        return 1
+    print(f"No regressions above {threshold}%.")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the question paper pipeline functions.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help="run benchmarks and save a JSON baseline")
+    run.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(SCALES))
+    run.add_argument('-k', action='append', help="only cases whose name contains this (repeatable)")
+    run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run.add_argument('-o', '--output', help="result file (default: benchmarks/baselines/<timestamp>.json)")
+    run.add_argument('--compare-to', help="baseline to compare the new results against")
+    run.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="regression threshold in percent")
+    run.set_defaults(func=cmd_run)
+
+    compare = subparsers.add_parser('compare', help="compare two saved result files")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="regression threshold in percent")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import json
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph
+
+# Synthetic inputs shaped like real syllabi, LLM output and question banks
+
+TOPICS_PER_UNIT = 8
+WORDS = (
+    "analysis design process memory network system control data structure model "
+    "algorithm protocol circuit signal storage security interface method theory"
+).split()
+
+def _phrase(seed, length):
+    return ' '.join(WORDS[(seed * 7 + i * 3) % len(WORDS)] for i in range(length))
+
+# Function: Syllabus Text with `num_units` Units
+def make_syllabus_text(num_units):
+    lines = ["Course Syllabus", "Course Outcomes and Objectives", ""]
+    for unit in range(1, num_units + 1):
+        lines.append(f"Unit {unit}: {_phrase(unit, 3).title()}")
+        for topic in range(TOPICS_PER_UNIT):
+            lines.append(f"{_phrase(unit * 31 + topic, 10)}.")
+        lines.append("")
+    return '\n'.join(lines)
+
+# Function: Write the Syllabus as a PDF
+def make_syllabus_pdf(filepath, num_units):
+    styles = getSampleStyleSheet()
+    elements = [Paragraph(line or '&nbsp;', styles['BodyText']) for line in make_syllabus_text(num_units).splitlines()]
+    SimpleDocTemplate(filepath, pagesize=letter).build(elements)
+
+# Function: Units Dict as extract_units_from_text Returns It
+def make_units(num_units):
+    return {f"Unit {unit}": f"Unit {unit}: {_phrase(unit, 3).title()}" for unit in range(1, num_units + 1)}
+
+# Function: LLM Output in the JSON Shape structured_output.build_output_schema Asks For
+def make_structured_output(num_units, per_marks):
+    units = []
+    for unit in range(1, num_units + 1):
+        questions = []
+        for marks in (4, 6):
+            for i in range(per_marks):
+                number = len(questions) + 1
+                questions.append({'text': f"{_phrase(unit + number, 12).capitalize()}?", 'marks': marks,
+                                  'co': unit, 'bt': 1 + i % 6})
+        units.append({'unit': f"Unit {unit}", 'questions': questions})
+    return json.dumps({'units': units}, indent=2)
+
+# Function: Question Bank in the Shape store_questions Takes
+def make_unit_questions(num_units, per_marks):
+    unit_questions = {}
+    for unit, title in make_units(num_units).items():
+        unit_questions[title] = {
+            marks: [
+                {'text': f"{_phrase(i, 12).capitalize()}? [CO:{unit.split()[1]}] [BT:{1 + i % 6}]", 'marks': marks}
+                for i in range(per_marks)
+            ]
+            for marks in ('4', '6')
+        }
+    return unit_questions
+
+# Function: One Paper (one question per marks per unit) from a Bank
+def make_paper(unit_questions):
+    return {unit: {marks: questions[:1] for marks, questions in marks_dict.items()}
+            for unit, marks_dict in unit_questions.items()}
@@ -1,18 +1,17 @@
+import hashlib
 import os
 import sqlite3
+import time
 import logging
+from metrics import timed_stage, QUESTIONS_TOTAL
 
-DATABASE = 'data/questions.db'
+logger = logging.getLogger(__name__)
 
-# Initialize Logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+DATABASE = 'data/questions.db'
 
 def init_db():
     os.makedirs('data', exist_ok=True)
-    logging.debug("Ensured that the data directory exists.")
+    logger.debug("Ensured that the data directory exists.")
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
 
@@ -22,9 +21,52 @@ def init_db():
         question TEXT NOT NULL,
         marks INTEGER NOT NULL
     )''')
+    # Rows tagged with the syllabus they came from (NULL for single-syllabus web uploads)
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(questions)')]
+    if 'syllabus' not in columns:
+        cursor.execute('ALTER TABLE questions ADD COLUMN syllabus TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_questions_syllabus ON questions (syllabus)')
+    # One row per Ollama generation, from the stats in its final `done` message
+    cursor.execute('''CREATE TABLE IF NOT EXISTS generation_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at REAL NOT NULL,
+        model TEXT NOT NULL,
+        syllabus TEXT,
+        unit TEXT,
+        prompt_eval_count INTEGER,
+        prompt_eval_duration INTEGER,
+        eval_count INTEGER,
+        eval_duration INTEGER,
+        load_duration INTEGER,
+        total_duration INTEGER
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_generation_stats_model ON generation_stats (model, syllabus, unit)')
+    # Section text of each unit in the bank, so the refill worker can generate more questions
+    # for a unit without the PDF (replaced together with the questions)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS unit_sources (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        syllabus TEXT,
+        unit TEXT NOT NULL,
+        section TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )''')
+    # Fingerprint of each section, compared on re-upload to regenerate only changed units
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(unit_sources)')]
+    if 'content_hash' not in columns:
+        cursor.execute('ALTER TABLE unit_sources ADD COLUMN content_hash TEXT')
+        cursor.executemany('UPDATE unit_sources SET content_hash = ? WHERE id = ?', [
+            (section_hash(section), source_id)
+            for source_id, section in cursor.execute('SELECT id, section FROM unit_sources').fetchall()
+        ])
+    # Foreground Ollama calls in flight per process, for the refill worker's idle check
+    cursor.execute('''CREATE TABLE IF NOT EXISTS generation_activity (
+        pid INTEGER PRIMARY KEY,
+        in_flight INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )''')
     conn.commit()
     conn.close()
-    logging.info("Database initialized successfully.")
+    logger.info("Database initialized successfully.")
 
 def clear_questions():
     conn = sqlite3.connect(DATABASE)
@@ -32,36 +74,186 @@ def clear_questions():
     cursor.execute('DELETE FROM questions')
     conn.commit()
     conn.close()
-    logging.info("Cleared all existing questions from the database.")
+    logger.info("Cleared all existing questions from the database.")
 
-def store_questions(unit_questions):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+def _insert_questions(cursor, unit_questions, syllabus):
     for unit, marks_dict in unit_questions.items():
         for mark, questions in marks_dict.items():
             for question_data in questions:
                 question_text = question_data['text']
                 cursor.execute(
-                    'INSERT INTO questions (unit, question, marks) VALUES (?, ?, ?)',
-                    (unit, question_text, int(mark))
+                    'INSERT INTO questions (unit, question, marks, syllabus) VALUES (?, ?, ?, ?)',
+                    (unit, question_text, int(mark), syllabus)
                 )
-                logging.debug(f"Stored question for {unit}: {question_text} ({mark} marks)")
+                logger.debug("Stored question for %s: %s (%s marks)", unit, question_text, mark)
+            QUESTIONS_TOTAL.inc('stored', amount=len(questions))
+
+@timed_stage('store_questions')
+def store_questions(unit_questions, syllabus=None):
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    _insert_questions(cursor, unit_questions, syllabus)
+    conn.commit()
+    conn.close()
+    logger.info("All questions have been stored in the database.")
+
+def section_hash(section):
+    # Whitespace-insensitive, as PDF extraction of the same text varies its spacing
+    return hashlib.sha256(' '.join(section.split()).encode('utf-8')).hexdigest()
+
+def unit_source_rows(sources, syllabus):
+    now = time.time()
+    return [(syllabus, unit, section, section_hash(section), now) for unit, section in sources.items()]
+
+# Sections of one syllabus (the untagged web-upload bank for None)
+REPLACED_SOURCES_QUERY = 'DELETE FROM unit_sources WHERE syllabus IS ?'
+
+def _replace_unit_sources(cursor, sources, syllabus):
+    cursor.execute(REPLACED_SOURCES_QUERY, (syllabus,))
+    cursor.executemany(
+        'INSERT INTO unit_sources (syllabus, unit, section, content_hash, updated_at) VALUES (?, ?, ?, ?, ?)',
+        unit_source_rows(sources, syllabus)
+    )
+
+# Function: DELETE of the Rows replace_questions Swaps Out
+def replaced_questions_query(syllabus, keep_units=()):
+    """
+    The rows of `syllabus` (untagged rows when syllabus is None) except the rows of
+    `keep_units`; other syllabi are never touched. Returns (sql, params).
+    """
+    keep_units = list(keep_units)
+    if not keep_units:
+        return 'DELETE FROM questions WHERE syllabus IS ?', [syllabus]
+    placeholders = ', '.join('?' * len(keep_units))
+    return f'DELETE FROM questions WHERE syllabus IS ? AND unit NOT IN ({placeholders})', [syllabus, *keep_units]
+
+@timed_stage('store_questions')
+def replace_questions(unit_questions, syllabus=None, sources=None, keep_units=()):
+    """
+    Swap in a new set of questions in one transaction, so readers never see a half-empty
+    bank: the rows of `syllabus`, or the untagged web-upload rows when it is None. Questions of
+    `keep_units` (units whose section did not change) stay as they are. `sources`
+    ({unit: section text}) replaces the stored unit sections the same way.
+    """
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(*replaced_questions_query(syllabus, keep_units))
+    _insert_questions(cursor, unit_questions, syllabus)
+    if sources is not None:
+        _replace_unit_sources(cursor, sources, syllabus)
     conn.commit()
     conn.close()
-    logging.info("All questions have been stored in the database.")
+    logger.info("Replaced the questions of %s (%s units kept).", syllabus or 'the web-upload bank', len(keep_units))
+
+# The bank of one syllabus (the untagged web-upload bank for None); units of different
+# syllabi may share a heading, so they are never read together
+BANK_QUERY = 'SELECT id, unit, question, marks FROM questions WHERE syllabus IS ? ORDER BY id'
 
-def get_all_questions_by_unit():
+@timed_stage('bank_read')
+def get_all_questions_by_unit(syllabus=None):
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
-    cursor.execute('SELECT unit, question, marks FROM questions')
+    cursor.execute(BANK_QUERY, (syllabus,))
     questions = cursor.fetchall()
     conn.close()
 
     unit_questions = {}
-    for unit, question, marks in questions:
+    for question_id, unit, question, marks in questions:
         if unit not in unit_questions:
             unit_questions[unit] = {'4': [], '6': []}
-        question_data = {'text': question, 'marks': marks}
+        question_data = {'id': question_id, 'text': question, 'marks': marks}
         unit_questions[unit][str(marks)].append(question_data)
-    logging.debug(f"Retrieved questions grouped by unit: {unit_questions}")
+    logger.debug("Retrieved %d questions across %d units.", len(questions), len(unit_questions))
     return unit_questions
+
+def get_question_rows():
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('SELECT syllabus, unit, marks, question FROM questions ORDER BY id')
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# Stored section hashes of the units that still have questions
+UNIT_HASHES_QUERY = (
+    'SELECT unit, content_hash FROM unit_sources AS s WHERE syllabus IS ? AND EXISTS '
+    '(SELECT 1 FROM questions AS q WHERE q.syllabus IS s.syllabus AND q.unit = s.unit)'
+)
+
+def get_unit_hashes(syllabus=None):
+    """
+    Return {unit: content hash} for the stored sections of `syllabus` (untagged ones when
+    None) whose unit still has questions in the bank.
+    """
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(UNIT_HASHES_QUERY, (syllabus,))
+    hashes = dict(cursor.fetchall())
+    conn.close()
+    return hashes
+
+def get_unit_sources():
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('SELECT syllabus, unit, section FROM unit_sources ORDER BY id')
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# Function: Count a Foreground Ollama Call In or Out
+def update_generation_activity(pid, delta):
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO generation_activity (pid, in_flight, updated_at) VALUES (?, MAX(0, ?), ?) '
+        'ON CONFLICT(pid) DO UPDATE SET in_flight = MAX(0, in_flight + ?), updated_at = excluded.updated_at',
+        (pid, delta, time.time(), delta)
+    )
+    conn.commit()
+    conn.close()
+
+def get_generation_activity(since):
+    """
+    Return (calls in flight, time of the latest start or end) over all processes; rows not
+    updated since `since` are ignored (their process is gone or stuck).
+    """
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT COALESCE(SUM(CASE WHEN updated_at >= ? THEN in_flight ELSE 0 END), 0), MAX(updated_at) '
+        'FROM generation_activity', (since,)
+    )
+    in_flight, last_activity = cursor.fetchone()
+    conn.close()
+    return in_flight, last_activity
+
+# Ollama reports counts in tokens and durations in nanoseconds
+GENERATION_STAT_FIELDS = (
+    'prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration', 'load_duration', 'total_duration'
+)
+
+def store_generation_stats(model, syllabus, unit, stats):
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO generation_stats (created_at, model, syllabus, unit, '
+        + ', '.join(GENERATION_STAT_FIELDS) + ') VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (time.time(), model, syllabus, unit, *(stats.get(field) for field in GENERATION_STAT_FIELDS))
+    )
+    conn.commit()
+    conn.close()
+    logger.debug("Stored generation stats for %s (%s, %s).", model, syllabus, unit)
+
+def get_generation_stats(model=None, syllabus=None, unit=None):
+    filters = [(column, value) for column, value in (('model', model), ('syllabus', syllabus), ('unit', unit)) if value]
+    where = ' AND '.join(f'{column} = ?' for column, _ in filters)
+    conn = sqlite3.connect(DATABASE)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT * FROM generation_stats' + (f' WHERE {where}' if where else '') + ' ORDER BY id',
+        [value for _, value in filters]
+    )
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
@@ -0,0 +1,169 @@
+"""
+Offline batch ingest: generate and store questions for every syllabus PDF in a directory.
+
+    python ingest.py uploads/                       # 4 parsing processes, 2 LLM calls at a time
+    python ingest.py syllabi/ --cpu-workers 8 --llm-workers 1 --report ingest_report.json
+
+PDF text and unit extraction run in a process pool (--cpu-workers); generation, parsing
+and storage run in a thread pool (--llm-workers) sized for what the Ollama host can serve.
+Each syllabus replaces only its own questions in the bank, tagged with its file name; a
+revised file regenerates only the units whose section text changed.
+
+Progress is appended to a JSON-lines state file (default <directory>/.ingest_progress.jsonl)
+after every file, so an interrupted run can simply be started again: files already ingested
+with the same content are skipped, failed and new or changed files are processed.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from database import init_db, replace_questions
+from question_pipeline import extract_text_from_pdf, extract_units_from_text
+from unit_revisions import revise_unit_questions
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CPU_WORKERS = int(os.environ.get('QP_INGEST_CPU_WORKERS', min(4, os.cpu_count() or 1)))
+DEFAULT_LLM_WORKERS = int(os.environ.get('QP_INGEST_LLM_WORKERS', 2))
+STATE_FILENAME = '.ingest_progress.jsonl'
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function: Latest Progress Record per File
+def load_progress(state_path):
+    progress = {}
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    progress[record['file']] = record
+    return progress
+
+def append_progress(state_path, record):
+    with open(state_path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+# Function: CPU Stage (runs in a worker process)
+def extract_syllabus(path):
+    start = time.perf_counter()
+    text = extract_text_from_pdf(path)
+    return text, extract_units_from_text(text), time.perf_counter() - start
+
+# Function: LLM Stage (runs in a worker thread)
+def generate_and_store(syllabus, text, units, model):
+    start = time.perf_counter()
+    # model=None generates on the routed models (model_router.MODEL_ROUTES); units whose
+    # section is unchanged since the last ingest of this file name keep their questions
+    revision = revise_unit_questions(units, text, syllabus, syllabus=syllabus, models=[model] if model else None)
+    replace_questions(revision.unit_questions, syllabus=syllabus, sources=revision.sources, keep_units=revision.unchanged)
+    questions = sum(len(q) for marks_dict in revision.unit_questions.values() for q in marks_dict.values())
+    return questions, len(revision.unchanged), time.perf_counter() - start
+
+# Function: Ingest Every Pending PDF in a Directory
+def ingest_directory(directory, cpu_workers, llm_workers, state_path, model=None):
+    """
+    Run both stages over the PDFs that are not yet ingested and return this run's
+    per-file records.
+    """
+    progress = load_progress(state_path)
+    pending = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.pdf'))):
+        name = os.path.basename(path)
+        sha256 = file_sha256(path)
+        previous = progress.get(name)
+        if previous and previous['status'] == 'done' and previous['sha256'] == sha256:
+            logger.info("Skipping %s (already ingested).", name)
+            continue
+        pending.append((path, name, sha256))
+    logger.info("%s syllabi to ingest from %s.", len(pending), directory)
+
+    records = []
+
+    def finish(record):
+        record['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        append_progress(state_path, record)
+        records.append(record)
+        if record['status'] == 'done':
+            logger.info("Ingested %s: %s questions.", record['file'], record['questions'])
+        else:
+            logger.error("Failed %s at %s: %s", record['file'], record['stage'], record['error'])
+
+    with ProcessPoolExecutor(max_workers=cpu_workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=llm_workers) as llm_pool:
+        extract_futures = {cpu_pool.submit(extract_syllabus, path): (name, sha256) for path, name, sha256 in pending}
+        generate_futures = {}
+        for future in as_completed(extract_futures):
+            name, sha256 = extract_futures[future]
+            record = {'file': name, 'sha256': sha256}
+            try:
+                text, units, extract_seconds = future.result()
+            except Exception as e:
+                finish({**record, 'status': 'failed', 'stage': 'extract', 'error': str(e)})
+                continue
+            record.update(units=len(units), extract_seconds=round(extract_seconds, 3))
+            if not units:
+                finish({**record, 'status': 'failed', 'stage': 'extract', 'error': "No units found in the syllabus text."})
+                continue
+            generate_futures[llm_pool.submit(generate_and_store, name, text, units, model)] = record
+
+        for future in as_completed(generate_futures):
+            record = generate_futures[future]
+            try:
+                questions, unchanged_units, generate_seconds = future.result()
+            except Exception as e:
+                finish({**record, 'status': 'failed', 'stage': 'generate', 'error': str(e)})
+                continue
+            finish({**record, 'status': 'done', 'questions': questions, 'unchanged_units': unchanged_units,
+                    'generate_seconds': round(generate_seconds, 3)})
+    return records
+
+def print_report(records):
+    for record in sorted(records, key=lambda record: record['file']):
+        if record['status'] == 'done':
+            detail = f"{record['units']} units ({record.get('unchanged_units', 0)} unchanged), " \
+                     f"{record['questions']} new questions, " \
+                     f"extract {record['extract_seconds']}s, generate {record['generate_seconds']}s"
+        else:
+            detail = f"{record['stage']}: {record['error']}"
+        print(f"{record['status']:7} {record['file']:40} {detail}")
+    done = sum(1 for record in records if record['status'] == 'done')
+    print(f"{done} ingested, {len(records) - done} failed.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and store questions for a directory of syllabus PDFs.")
+    parser.add_argument('directory')
+    parser.add_argument('--cpu-workers', type=int, default=DEFAULT_CPU_WORKERS, help="processes for PDF parsing")
+    parser.add_argument('--llm-workers', type=int, default=DEFAULT_LLM_WORKERS, help="concurrent LLM generations")
+    parser.add_argument('--state', help=f"progress file (default: <directory>/{STATE_FILENAME})")
+    parser.add_argument('--report', help="also write this run's per-file records as JSON")
+    parser.add_argument('--model', help="generate every bucket on this model (default: the QP_MODEL_ROUTES routes)")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    init_db()
+    records = ingest_directory(
+        args.directory, args.cpu_workers, args.llm_workers,
+        args.state or os.path.join(args.directory, STATE_FILENAME), model=args.model
+    )
+    print_report(records)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(records, file, indent=2)
+    return 0 if all(record['status'] == 'done' for record in records) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
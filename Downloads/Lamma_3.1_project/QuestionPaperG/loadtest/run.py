@@ -0,0 +1,211 @@
+"""
+Load generator for the HTTP API.
+
+Replays a weighted mix of syllabus uploads (/generate-questions), question paper specs
+(/generate-qp, shaped like the ones index2.html builds) and /download calls at
+increasing concurrency, then reports throughput, latency percentiles and error rate per
+endpoint and step, and where each endpoint saturates.
+
+Typical local run (async_app serves all three endpoints):
+
+    python -m loadtest.stub_ollama --port 11435 &
+    QP_OLLAMA_URL=http://localhost:11435/api/generate hypercorn async_app:app --bind 0.0.0.0:8000 --workers 4 &
+    python -m loadtest.run --base-url http://localhost:8000 --concurrency 1 2 4 8 16 32 --duration 20
+
+An endpoint saturates at the last step after which its throughput grows by less than
+--saturation-gain, or where its error rate first exceeds 1%.
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+import requests
+from benchmarks import synthetic
+
+DEFAULT_MIX = 'upload=1,generate_qp=8,download=4'
+DEFAULT_CONCURRENCY = [1, 2, 4, 8, 16]
+SYLLABUS_UNITS = 5
+# Questions per marks value the bank holds for every unit (question_pipeline.QUESTIONS_PER_UNIT)
+BANK_PER_MARKS = 3
+MAX_DOWNLOAD_URLS = 200
+
+class LoadClient:
+    """
+    One simulated teacher: a requests.Session plus the state shared by all of them
+    (bank units and download links seen so far).
+    """
+    def __init__(self, base_url, syllabus_pdf, shared, rng):
+        self.base_url = base_url.rstrip('/')
+        self.syllabus_pdf = syllabus_pdf
+        self.shared = shared
+        self.rng = rng
+        self.session = requests.Session()
+
+    def upload(self):
+        response = self.session.post(
+            f'{self.base_url}/generate-questions',
+            files={'syllabus': ('syllabus.pdf', self.syllabus_pdf, 'application/pdf')},
+        )
+        if response.ok:
+            self.shared['units'] = response.json().get('units') or self.shared['units']
+        return response
+
+    def generate_qp(self, inline=None):
+        units = self.shared['units']
+        chosen = self.rng.sample(units, self.rng.randint(1, len(units)))
+        unit_details = [
+            {'unit': unit, 'questions': {'4': self.rng.randint(1, BANK_PER_MARKS - 1),
+                                         '6': self.rng.randint(1, BANK_PER_MARKS - 1)}}
+            for unit in chosen
+        ]
+        spec = {
+            'total_marks': sum(4 * unit['questions']['4'] + 6 * unit['questions']['6'] for unit in unit_details),
+            'unit_details': unit_details,
+            # index2.html downloads inline; older clients follow a download_url
+            'inline': self.rng.random() < 0.5 if inline is None else inline,
+        }
+        response = self.session.post(f'{self.base_url}/generate-qp', json=spec)
+        if response.ok and not spec['inline']:
+            urls = self.shared['download_urls']
+            urls.append(response.json()['download_url'])
+            del urls[:-MAX_DOWNLOAD_URLS]
+        return response
+
+    def download(self):
+        return self.session.get(self.base_url + self.rng.choice(self.shared['download_urls']))
+
+# Function: Parse "name=weight,..." into (names, weights)
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in ('upload', 'generate_qp', 'download'):
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return list(mix), list(mix.values())
+
+# Function: Run One Concurrency Step
+def run_step(base_url, syllabus_pdf, shared, concurrency, duration, mix, seed):
+    """
+    Keep `concurrency` clients busy for `duration` seconds. Returns a list of
+    (endpoint, latency seconds, ok) samples.
+    """
+    names, weights = mix
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = LoadClient(base_url, syllabus_pdf, shared, rng)
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            if endpoint == 'download' and not shared['download_urls']:
+                # Nothing to download yet: build a paper instead, and record it as one
+                endpoint = 'generate_qp'
+            start = time.perf_counter()
+            try:
+                ok = getattr(client, endpoint)().ok
+            except requests.RequestException:
+                ok = False
+            with lock:
+                samples.append((endpoint, time.perf_counter() - start, ok))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+# Function: Per-endpoint Statistics of One Step
+def summarize_step(samples, duration):
+    stats = {}
+    for endpoint in sorted({sample[0] for sample in samples}):
+        latencies = sorted(latency for name, latency, _ in samples if name == endpoint)
+        errors = sum(1 for name, _, ok in samples if name == endpoint and not ok)
+        stats[endpoint] = {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / duration, 2),
+            'error_rate': round(errors / len(latencies), 4),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p90_ms': round(percentile(latencies, 0.90) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        }
+    return stats
+
+# Function: Concurrency at Which Each Endpoint Stops Scaling
+def find_saturation(steps, min_gain):
+    saturation = {}
+    endpoints = {endpoint for step in steps for endpoint in step['endpoints']}
+    for endpoint in sorted(endpoints):
+        previous = None
+        for step in steps:
+            stats = step['endpoints'].get(endpoint)
+            if stats is None:
+                continue
+            if stats['error_rate'] > 0.01:
+                saturation[endpoint] = {'concurrency': step['concurrency'], 'reason': 'errors above 1%'}
+                break
+            if previous and stats['throughput_rps'] < previous[1]['throughput_rps'] * (1 + min_gain):
+                saturation[endpoint] = {'concurrency': previous[0], 'reason': 'throughput stopped growing'}
+                break
+            previous = (step['concurrency'], stats)
+        else:
+            saturation[endpoint] = {'concurrency': None, 'reason': 'not saturated in the tested range'}
+    return saturation
+
+def print_step(step):
+    print(f"\nconcurrency {step['concurrency']}")
+    print(f"  {'endpoint':12} {'reqs':>6} {'rps':>8} {'err%':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in step['endpoints'].items():
+        print(f"  {endpoint:12} {stats['requests']:6} {stats['throughput_rps']:8.2f} {stats['error_rate'] * 100:6.1f} "
+              f"{stats['p50_ms']:9.1f} {stats['p90_ms']:9.1f} {stats['p99_ms']:9.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the question paper API.")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds per concurrency step")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="endpoint weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument('--saturation-gain', type=float, default=0.10,
+                        help="minimum relative throughput gain per step before an endpoint counts as saturated")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', help="also write the full report as JSON")
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as file:
+        synthetic.make_syllabus_pdf(file.name, SYLLABUS_UNITS)
+        syllabus_pdf = file.read()
+
+    # Seed the bank and a first download link so every endpoint has something to work on
+    shared = {'units': [], 'download_urls': []}
+    seeder = LoadClient(args.base_url, syllabus_pdf, shared, random.Random(args.seed))
+    response = seeder.upload()
+    if not response.ok or not shared['units']:
+        parser.error(f"Seeding upload failed ({response.status_code}): {response.text[:200]}")
+    seeder.generate_qp(inline=False)
+
+    steps = []
+    for concurrency in args.concurrency:
+        samples = run_step(args.base_url, syllabus_pdf, shared, concurrency, args.duration, mix, args.seed)
+        steps.append({'concurrency': concurrency, 'endpoints': summarize_step(samples, args.duration)})
+        print_step(steps[-1])
+
+    saturation = find_saturation(steps, args.saturation_gain)
+    print("\nsaturation")
+    for endpoint, point in saturation.items():
+        print(f"  {endpoint:12} {point['concurrency'] or '-':>6}  {point['reason']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'args': vars(args), 'steps': steps, 'saturation': saturation}, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Stand-in for Ollama's /api/generate, for load tests without a GPU.
+
+    python -m loadtest.stub_ollama --port 11435 --first-token-delay 0.5 --tokens-per-second 200
+    QP_OLLAMA_URL=http://localhost:11435/api/generate python serve.py --app async_app:app ...
+
+Reads the unit list out of the prompt built by question_pipeline.build_prompt and streams
+back 3 questions per unit for each marks value the instructions name (four-mark and
+six-mark by default) in the SYSTEM_PROMPT format, one word per chunk at the configured rate. The closing `done` message carries the same token
+counts and durations as the real API, and a `context` (one entry per word) that a
+follow-up call can send back: only the new prompt words then count as evaluated.
+When the request has a `format` JSON schema the answer is a {"units": [...]} document for
+the unit ids and marks values the schema allows, with as many questions per unit as the
+schema requires, as Ollama's structured outputs return it.
+--incomplete-rate drops the last question of a unit with that probability, to exercise
+the repair calls.
+"""
+import argparse
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+UNIT_LINE = re.compile(r'^Unit\s+(\d+)\b', re.IGNORECASE)
+MARKS_NAMES = {'4': 'four-mark', '6': 'six-mark'}
+# Varied wording so the question ranking does not drop stub questions as near-duplicates
+QUESTION_VERBS = ['Explain', 'Describe', 'Compare', 'Illustrate', 'Analyse', 'Evaluate', 'Summarise', 'Discuss']
+QUESTION_SUBJECTS = ['the core idea', 'the main algorithm', 'two practical uses', 'the design trade-offs',
+                     'a common failure case', 'the key definitions', 'the historical context', 'a worked \"example\"']
+
+# Function: Unit Numbers Listed in the Prompt's "Units:" Section
+def prompt_units(prompt):
+    section = prompt.split('Units:', 1)[-1].split('Text:', 1)[0]
+    units = [int(match.group(1)) for match in map(UNIT_LINE.match, section.strip().splitlines()) if match]
+    return units or [1]
+
+# Function: Marks Values the System Prompt or a Repair Prompt Asks For
+def requested_marks(instructions):
+    return [marks for marks, name in MARKS_NAMES.items() if name in instructions] or list(MARKS_NAMES)
+
+# Function: Generated Questions for Every Unit
+def stub_output(units, marks_values=tuple(MARKS_NAMES), incomplete_rate=0.0):
+    lines = []
+    for unit in units:
+        lines.append(f"Unit {unit}:")
+        marks_list = [marks for marks in marks_values for _ in range(3)]
+        if random.random() < incomplete_rate:
+            marks_list.pop()
+        for number, marks in enumerate(marks_list, 1):
+            lines.append(f"{number}. Explain topic {number} of unit {unit} with a worked example. "
+                         f"[CO:{unit}] [BT:{1 + number % 6}] ({marks} marks).")
+        lines.append("")
+    return '\n'.join(lines)
+
+# Function: Structured Answer for the Units and Marks a `format` Schema Allows
+def stub_structured_output(schema, incomplete_rate=0.0):
+    unit_schema = schema['properties']['units']['items']['properties']
+    items = unit_schema['questions']['items']
+    # Either one question schema, or one per marks value (anyOf) with its own BT levels
+    variants = items.get('anyOf', [items])
+    bt_levels = {marks: variant['properties']['bt']['enum']
+                 for variant in variants for marks in variant['properties']['marks']['enum']}
+    marks_values = list(bt_levels)
+    per_marks = unit_schema['questions']['minItems'] // len(marks_values)
+    units = []
+    for unit_id in unit_schema['unit']['enum']:
+        unit = int(re.search(r'\d+', unit_id).group())
+        marks_list = [marks for marks in marks_values for _ in range(per_marks)]
+        if random.random() < incomplete_rate:
+            marks_list.pop()
+        units.append({'unit': unit_id, 'questions': [
+            {'text': f"{QUESTION_VERBS[number % len(QUESTION_VERBS)]} "
+                     f"{random.choice(QUESTION_SUBJECTS)} of topic {random.randint(1, 20)} in unit {unit}.",
+             'marks': marks, 'co': unit, 'bt': bt_levels[marks][number % len(bt_levels[marks])]}
+            for number, marks in enumerate(marks_list, 1)
+        ]})
+    return json.dumps({'units': units}, indent=1)
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    first_token_delay = 0.5
+    tokens_per_second = 200.0
+    incomplete_rate = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = body.get('prompt', '')
+        model = body.get('model', 'stub')
+        context = body.get('context') or []
+        prompt_tokens = len(prompt.split()) + (0 if context else len(body.get('system', '').split()))
+        start = time.perf_counter()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(self.first_token_delay)
+        if body.get('format'):
+            output = stub_structured_output(body['format'], self.incomplete_rate)
+        else:
+            instructions = body.get('system', '') + prompt.split('Units:', 1)[0]
+            output = stub_output(prompt_units(prompt), requested_marks(instructions), self.incomplete_rate)
+        tokens = re.findall(r'\S+\s*', output)
+        eval_start = time.perf_counter()
+        for token in tokens:
+            self.write_chunk({'model': model, 'response': token, 'done': False})
+            time.sleep(1 / self.tokens_per_second)
+        now = time.perf_counter()
+        self.write_chunk({
+            'model': model, 'response': '', 'done': True,
+            'context': context + list(range(prompt_tokens + len(tokens))),
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(self.first_token_delay * 1e9),
+            'eval_count': len(tokens),
+            'eval_duration': int((now - eval_start) * 1e9),
+            'load_duration': 0,
+            'total_duration': int((now - start) * 1e9),
+        })
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, message):
+        data = json.dumps(message).encode() + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Ollama /api/generate for load tests.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--first-token-delay', type=float, default=StubOllamaHandler.first_token_delay,
+                        help="seconds before the first token (prompt evaluation)")
+    parser.add_argument('--tokens-per-second', type=float, default=StubOllamaHandler.tokens_per_second)
+    parser.add_argument('--incomplete-rate', type=float, default=StubOllamaHandler.incomplete_rate,
+                        help="probability that a unit misses its last question")
+    args = parser.parse_args(argv)
+
+    StubOllamaHandler.first_token_delay = args.first_token_delay
+    StubOllamaHandler.tokens_per_second = args.tokens_per_second
+    StubOllamaHandler.incomplete_rate = args.incomplete_rate
+    server = ThreadingHTTPServer((args.host, args.port), StubOllamaHandler)
+    print(f"Stub Ollama listening on http://{args.host}:{args.port}/api/generate")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
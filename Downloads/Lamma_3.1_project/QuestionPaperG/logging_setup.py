@@ -0,0 +1,116 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from collections import defaultdict
+
+# Configuration (environment overrides)
+#   QP_LOG_LEVEL         root level, e.g. INFO
+#   QP_LOG_LEVELS        per-module levels, e.g. "database=WARNING,pdf_renderer=DEBUG"
+#   QP_LOG_FILE          optional log file (written by the listener thread)
+#   QP_LOG_DEBUG_SAMPLE  keep 1 of every N DEBUG records per call site (1 keeps all)
+LOG_FORMAT = '%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LEVEL = os.environ.get('QP_LOG_LEVEL', 'INFO')
+DEFAULT_MODULE_LEVELS = os.environ.get('QP_LOG_LEVELS', '')
+DEFAULT_LOG_FILE = os.environ.get('QP_LOG_FILE')
+DEFAULT_DEBUG_SAMPLE = int(os.environ.get('QP_LOG_DEBUG_SAMPLE', 100))
+
+_listener = None
+_queue_handler = None
+
+class DebugSampler(logging.Filter):
+    """
+    Let through every record above DEBUG, but only one in `rate` DEBUG records from
+    each call site, so per-question and per-chunk debug lines stay affordable.
+    """
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, rate)
+        self.counts = defaultdict(int)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        self.counts[site] += 1
+        return self.counts[site] % self.rate == 1
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves %-formatting to the listener thread. Only the traceback is
+    rendered up front, since it cannot outlive the except block that produced it.
+    """
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def parse_module_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+# Function: Configure Non-blocking Logging for the Process
+def configure_logging(level=None, module_levels=None, log_file=None, debug_sample=None):
+    """
+    Route all records through a QueueHandler; a QueueListener thread does the actual
+    formatting and I/O so request threads only pay for an enqueue. Safe to call more
+    than once (later calls are ignored).
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    level = level or DEFAULT_LEVEL
+    module_levels = module_levels if module_levels is not None else parse_module_levels(DEFAULT_MODULE_LEVELS)
+    log_file = log_file or DEFAULT_LOG_FILE
+    debug_sample = DEFAULT_DEBUG_SAMPLE if debug_sample is None else debug_sample
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = DeferredQueueHandler(log_queue)
+    _queue_handler.addFilter(DebugSampler(debug_sample))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    # A forked worker (gunicorn, process pools) does not inherit the listener thread
+    os.register_at_fork(after_in_child=_restart_listener)
+
+def _restart_listener():
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """
+    Flush queued records and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
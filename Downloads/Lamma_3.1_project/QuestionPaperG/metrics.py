@@ -0,0 +1,106 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from request_trace import record_stage
+
+# Prometheus text exposition of pipeline stage timings. Metrics are kept per process:
+# behind a prefork server each worker reports its own numbers, and work done inside
+# render-pool processes is observed by the parent when the result comes back.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Stage latency buckets in seconds: PDF/DB stages are milliseconds, LLM calls are minutes
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+
+class Histogram:
+    def __init__(self, name, help_text, label_name, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label, value):
+        with _lock:
+            counts, total = self.series.get(label, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[label] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {label: (list(counts), total) for label, (counts, total) in self.series.items()}
+        for label, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{self.label_name}="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label_name}="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.label_name}="{label}"}} {cumulative}')
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            label_text = ','.join(f'{name}="{label}"' for name, label in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+STAGE_SECONDS = Histogram('qp_stage_seconds', 'Time spent in each pipeline stage.', 'stage', STAGE_BUCKETS)
+STAGE_TOTAL = Counter('qp_stage_total', 'Pipeline stage runs by outcome.', ('stage', 'outcome'))
+QUESTIONS_TOTAL = Counter('qp_questions_total', 'Questions parsed from LLM output and stored.', ('event',))
+MODEL_FALLBACKS = Counter('qp_model_fallbacks_total', 'Generations that failed on a routed model.', ('model',))
+
+REGISTRY = [STAGE_SECONDS, STAGE_TOTAL, QUESTIONS_TOTAL, MODEL_FALLBACKS]
+
+# Function: Record a Stage Duration
+def observe_stage(stage, seconds, outcome='ok'):
+    STAGE_SECONDS.observe(stage, seconds)
+    STAGE_TOTAL.inc(stage, outcome)
+    record_stage(stage, seconds)
+
+# Function: Time a Block as a Pipeline Stage
+@contextmanager
+def time_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        observe_stage(stage, time.perf_counter() - start, 'error')
+        raise
+    observe_stage(stage, time.perf_counter() - start)
+
+# Function: Decorator Form of time_stage
+def timed_stage(stage):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with time_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Function: Render All Metrics in Prometheus Text Format
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
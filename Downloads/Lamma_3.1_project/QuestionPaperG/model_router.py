@@ -0,0 +1,109 @@
+import logging
+import os
+from question_pipeline import QUESTIONS_PER_UNIT
+from token_budget import plan_prompt
+from ollama_client import generate_unit_questions, agenerate_unit_questions, OllamaError, DEFAULT_MODEL
+from metrics import MODEL_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Models per route, tried in order (the rest are fallbacks). A route is a task ("generate",
+# or "repair" for the follow-up calls that complete units missing questions), optionally
+# narrowed to a marks bucket ("generate:4"); unlisted routes use their task's models.
+# Repairs stay on the generating model (continuing its context) unless a repair route is set.
+# Overridable with QP_MODEL_ROUTES="generate:4=llama3.2:3b,llama3.1;generate:6=llama3.1;repair=llama3.1"
+MODEL_ROUTES = {
+    'generate': [DEFAULT_MODEL],
+}
+
+# Errors after which the next model of the route is tried: Ollama errors and timeouts
+# (OllamaError), a context window too small for the prompt, and output that is empty or
+# still misses questions after the repair call (ValueError)
+FALLBACK_ERRORS = (OllamaError, ValueError)
+
+def _parse_routes(spec):
+    routes = {}
+    for item in spec.split(';'):
+        if '=' in item:
+            route, models = item.split('=', 1)
+            routes[route.strip()] = [model.strip() for model in models.split(',') if model.strip()]
+            if not routes[route.strip()]:
+                raise ValueError(f"QP_MODEL_ROUTES: route '{route.strip()}' lists no models.")
+    return routes
+
+MODEL_ROUTES.update(_parse_routes(os.environ.get('QP_MODEL_ROUTES', '')))
+
+def models_for(task, marks=None):
+    if marks and f'{task}:{marks}' in MODEL_ROUTES:
+        return MODEL_ROUTES[f'{task}:{marks}']
+    return MODEL_ROUTES.get(task) or MODEL_ROUTES['generate']
+
+def repair_model_for(counts):
+    # The first model of a repair route for the bucket's marks, or None to repair on the generating model
+    for route in [f'repair:{marks}' for marks in counts] + ['repair']:
+        if route in MODEL_ROUTES:
+            return MODEL_ROUTES[route][0]
+    return None
+
+# Function: Group Marks Buckets by the Models They Route To
+def generation_buckets(models=None):
+    """
+    Return [(models, counts)] where counts is {marks: questions per unit}. Buckets routed
+    to the same models are generated together, so the default is a single generation.
+    """
+    buckets = {}
+    for marks, count in QUESTIONS_PER_UNIT.items():
+        bucket_models = tuple(models or models_for('generate', marks))
+        buckets.setdefault(bucket_models, {})[marks] = count
+    return list(buckets.items())
+
+def _fall_back(models, model, counts, error):
+    MODEL_FALLBACKS.inc(model)
+    if model == models[-1]:
+        raise error
+    logger.warning("Generation of %s-mark questions failed on %s (%s); falling back to %s.",
+                   '/'.join(counts), model, error, models[models.index(model) + 1])
+
+def _merge_bucket(unit_questions, bucket_questions, counts):
+    for title, questions in bucket_questions.items():
+        unit_questions.setdefault(title, {}).update({marks: questions[marks] for marks in counts})
+
+# Function: Generate the Questions of a Syllabus on the Routed Models (blocking)
+def route_unit_questions(units, syllabus_text, reference_text=None, syllabus=None, models=None, bt_levels=None):
+    """
+    Generate every marks bucket on its route's first model, falling back to the next on
+    failure. `models` overrides the routes; `bt_levels` ({marks: [levels]}) restricts the
+    Bloom's levels asked for. Returns (unit_questions, plans).
+    """
+    unit_questions = {}
+    plans = []
+    for bucket_models, counts in generation_buckets(models):
+        for model in bucket_models:
+            try:
+                plan = plan_prompt(units, syllabus_text, model, reference_text, counts, bt_levels)
+                bucket_questions = generate_unit_questions(plan, units, syllabus=syllabus,
+                                                           repair_model=repair_model_for(counts))
+                break
+            except FALLBACK_ERRORS as e:
+                _fall_back(bucket_models, model, counts, e)
+        _merge_bucket(unit_questions, bucket_questions, counts)
+        plans.append(plan)
+    return unit_questions, plans
+
+# Function: Generate the Questions of a Syllabus on the Routed Models (asyncio)
+async def aroute_unit_questions(client, units, syllabus_text, reference_text=None, syllabus=None, models=None,
+                                bt_levels=None):
+    unit_questions = {}
+    plans = []
+    for bucket_models, counts in generation_buckets(models):
+        for model in bucket_models:
+            try:
+                plan = plan_prompt(units, syllabus_text, model, reference_text, counts, bt_levels)
+                bucket_questions = await agenerate_unit_questions(client, plan, units, syllabus=syllabus,
+                                                                  repair_model=repair_model_for(counts))
+                break
+            except FALLBACK_ERRORS as e:
+                _fall_back(bucket_models, model, counts, e)
+        _merge_bucket(unit_questions, bucket_questions, counts)
+        plans.append(plan)
+    return unit_questions, plans
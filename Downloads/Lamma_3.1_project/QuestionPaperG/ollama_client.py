@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import httpx
+import requests
+from metrics import observe_stage
+from database import store_generation_stats, update_generation_activity
+from question_pipeline import build_repair_prompt, find_incomplete_units, check_unit_questions
+from structured_output import build_output_schema, UnitStreamDecoder, questions_from_units
+from question_ranking import rank_unit_questions
+from token_budget import planned_call, estimate_tokens, num_ctx_for
+
+logger = logging.getLogger(__name__)
+
+# QP_OLLAMA_URL points the app at another Ollama host (or the load-test stub)
+OLLAMA_URL = os.environ.get('QP_OLLAMA_URL', 'http://localhost:11434/api/generate')
+# Text model used when no route names one (QP_MODEL_ROUTES in model_router)
+DEFAULT_MODEL = os.environ.get('QP_DEFAULT_MODEL', 'llama3.1')
+# Connections kept open to Ollama by the blocking client, shared by all request threads
+OLLAMA_POOL_SIZE = int(os.environ.get('QP_OLLAMA_MAX_CONNECTIONS', 100))
+# Seconds Ollama may go without sending a chunk (model load and prompt evaluation included)
+# before the generation fails and the model router can fall back to another model
+OLLAMA_READ_TIMEOUT = float(os.environ.get('QP_OLLAMA_READ_TIMEOUT', 300))
+OLLAMA_CONNECT_TIMEOUT = 10.0
+# Calls are counted in and out of the generation_activity table so the refill worker only
+# generates while Ollama is idle. Off unless QP_TRACK_GENERATION_ACTIVITY=1 (set it for the
+# app and ingest when a refill worker runs); the worker turns it off for its own calls
+RECORD_ACTIVITY = os.environ.get('QP_TRACK_GENERATION_ACTIVITY') == '1'
+
+_session = requests.Session()
+_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=OLLAMA_POOL_SIZE))
+_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=OLLAMA_POOL_SIZE))
+
+class OllamaError(Exception):
+    pass
+
+class GenerationTimer:
+    """
+    Tracks time-to-first-token and total time of one streamed generation.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.done = None
+
+    def token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            observe_stage('ollama_first_token', self.first_token_at - self.start)
+
+    def finish(self, outcome='ok'):
+        observe_stage('ollama_total', time.perf_counter() - self.start, outcome)
+
+# Function: Handle One Line of the Ollama Stream
+def read_stream_line(line, chunks, timer, decoder=None):
+    """
+    Append the response text of a stream line to `chunks` (and feed it to `decoder`);
+    return True on the final line, whose token counts and durations are kept on `timer.done`.
+    """
+    json_line = json.loads(line)
+    if json_line.get('response'):
+        timer.token()
+        chunks.append(json_line['response'])
+        if decoder:
+            decoder.feed(json_line['response'])
+    if json_line.get('done'):
+        timer.done = json_line
+        return True
+    return False
+
+# Function: Persist the Stats of a Finished Generation
+def record_generation_stats(model, syllabus, unit, done):
+    """
+    Store the `done` message stats; a failure here is logged and never fails the generation.
+    """
+    if not done:
+        logger.warning("Generation for %s ended without a done message; no stats recorded.", model)
+        return
+    try:
+        store_generation_stats(model, syllabus, unit, done)
+    except Exception:
+        logger.exception("Could not record generation stats.")
+
+def record_activity(delta):
+    if not RECORD_ACTIVITY:
+        return
+    try:
+        update_generation_activity(os.getpid(), delta)
+    except Exception:
+        logger.exception("Could not record generation activity.")
+
+# Function: JSON Body of an /api/generate Call
+def request_body(prompt, model, num_ctx=None, system=None, context=None, output_format=None):
+    body = {"model": model, "prompt": prompt}
+    if output_format:
+        body["format"] = output_format
+    if system:
+        body["system"] = system
+    if context:
+        body["context"] = context
+    if num_ctx:
+        body["options"] = {"num_ctx": num_ctx}
+    return body
+
+# Function: Stream a Generation (blocking)
+def generate_turn(prompt, model=DEFAULT_MODEL, syllabus=None, unit=None, num_ctx=None, system=None, context=None,
+                  output_format=None, decoder=None):
+    """
+    Stream one generation and return (text, context). Passing the returned context to a
+    follow-up call continues the conversation without re-evaluating its tokens;
+    `output_format` is a JSON schema the answer must follow, decoded as it streams by `decoder`.
+    """
+    timer = GenerationTimer()
+    chunks = []
+    record_activity(1)
+    try:
+        body = request_body(prompt, model, num_ctx, system, context, output_format)
+        response = _session.post(OLLAMA_URL, json=body, stream=True, timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT))
+        if response.status_code != 200:
+            raise OllamaError(f"AI API returned status code {response.status_code}")
+        for line in response.iter_lines():
+            if line and read_stream_line(line, chunks, timer, decoder):
+                break
+    except requests.RequestException as e:
+        timer.finish('error')
+        raise OllamaError(f"AI API request failed: {e}") from e
+    except Exception:
+        timer.finish('error')
+        raise
+    finally:
+        record_activity(-1)
+    timer.finish()
+    record_generation_stats(model, syllabus, unit, timer.done)
+    return ''.join(chunks), (timer.done or {}).get('context')
+
+def generate(prompt, model=DEFAULT_MODEL, syllabus=None, unit=None, num_ctx=None, system=None):
+    return generate_turn(prompt, model, syllabus, unit, num_ctx, system)[0]
+
+# Function: Stream a Generation (asyncio, shared httpx.AsyncClient)
+async def agenerate_turn(client, prompt, model=DEFAULT_MODEL, syllabus=None, unit=None, num_ctx=None,
+                         system=None, context=None, output_format=None, decoder=None):
+    timer = GenerationTimer()
+    chunks = []
+    await asyncio.to_thread(record_activity, 1)
+    try:
+        body = request_body(prompt, model, num_ctx, system, context, output_format)
+        async with client.stream('POST', OLLAMA_URL, json=body) as response:
+            if response.status_code != 200:
+                raise OllamaError(f"AI API returned status code {response.status_code}")
+            async for line in response.aiter_lines():
+                if line and read_stream_line(line, chunks, timer, decoder):
+                    break
+    except httpx.HTTPError as e:
+        timer.finish('error')
+        raise OllamaError(f"AI API request failed: {e!r}") from e
+    except Exception:
+        timer.finish('error')
+        raise
+    finally:
+        await asyncio.to_thread(record_activity, -1)
+    timer.finish()
+    await asyncio.to_thread(record_generation_stats, model, syllabus, unit, timer.done)
+    return ''.join(chunks), (timer.done or {}).get('context')
+
+async def agenerate(client, prompt, model=DEFAULT_MODEL, syllabus=None, unit=None, num_ctx=None, system=None):
+    return (await agenerate_turn(client, prompt, model, syllabus, unit, num_ctx, system))[0]
+
+def _call_unit(call):
+    # Stats of a per-unit call are keyed by its unit
+    return call.units[0] if len(call.units) == 1 else None
+
+# Function: Context a Follow-up Call Can Continue From
+def continue_context(plan, call, context):
+    """
+    Return `context` when the call's prompt and output still fit in num_ctx on top of it
+    (the system prompt and earlier turns are then not evaluated again), else None.
+    """
+    if not context:
+        return None
+    added_tokens = call.prompt_tokens - estimate_tokens(plan.system) + call.output_tokens
+    return context if len(context) + added_tokens <= plan.num_ctx else None
+
+def _turn_args(plan, call, context):
+    context = continue_context(plan, call, context)
+    # A continued conversation already holds the system prompt
+    return {'model': plan.model, 'unit': _call_unit(call), 'num_ctx': plan.num_ctx,
+            'system': None if context else plan.system, 'context': context,
+            'output_format': build_output_schema(call.units, plan.requested, plan.bt_levels), 'decoder': UnitStreamDecoder()}
+
+# Function: Repair Calls for Units Missing Questions
+def repair_calls(plan, units, unit_questions, contexts, sources, repair_model=None):
+    """
+    One follow-up call per context that produced incomplete units, asking for just those
+    units again. Units whose context has no room left are not repaired. With a
+    `repair_model` other than plan.model (a context only continues on the model that
+    produced it), each call instead starts afresh on it from the prompt of the call that
+    produced the units (`sources`, {unit_id: call}). Returns [(call, context)].
+    """
+    fresh = repair_model not in (None, plan.model)
+    unit_ids = {title: unit_id for unit_id, title in units.items()}
+    groups = {}
+    for title in find_incomplete_units(unit_questions, plan.counts):
+        unit_id = unit_ids[title]
+        origin = sources.get(unit_id) if fresh else contexts.get(unit_id)
+        if origin:
+            groups.setdefault(id(origin), (origin, []))[1].append(unit_id)
+    calls = []
+    for origin, group in groups.values():
+        if fresh:
+            prompt = f"{origin.prompt}\n\n{build_repair_prompt(group, plan.requested)}"
+            call = planned_call(group, prompt, plan.system, plan.requested)
+            if call.prompt_tokens + call.output_tokens <= num_ctx_for(repair_model):
+                calls.append((call, None))
+                continue
+        else:
+            call = planned_call(group, build_repair_prompt(group, plan.requested), plan.system, plan.requested)
+            if continue_context(plan, call, origin):
+                calls.append((call, origin))
+                continue
+        logger.warning("No room in the context window to repair %s.", group)
+    return calls
+
+def _repair_args(plan, call, context, repair_model):
+    args = _turn_args(plan, call, context)
+    if repair_model not in (None, plan.model):
+        args.update(model=repair_model, num_ctx=num_ctx_for(repair_model))
+    return args
+
+def merge_repair(plan, unit_questions, units, call, decoded_units):
+    # Repaired candidates are ranked together with what the unit already had
+    repair_units = {unit_id: units[unit_id] for unit_id in call.units}
+    for title, questions in questions_from_units(decoded_units, repair_units, plan.requested).items():
+        for marks in plan.counts:
+            questions[marks] = unit_questions[title][marks] + questions[marks]
+        unit_questions.update(rank_unit_questions({title: questions}, plan.counts))
+
+def _plan_questions(decoded_units, units, plan):
+    if not decoded_units:
+        raise ValueError("No questions received from AI API.")
+    return rank_unit_questions(questions_from_units(decoded_units, units, plan.requested), plan.counts)
+
+# Function: Generate the Questions of a Prompt Plan (blocking)
+def generate_unit_questions(plan, units, syllabus=None, repair_model=None):
+    """
+    Run the calls of a token_budget.PromptPlan in order, continuing from the previous
+    call's context while it fits, then repair incomplete units from the context that
+    produced them (or on `repair_model`, see repair_calls). Each unit asks for
+    plan.requested candidates and gets them ranked (question_ranking), best plan.counts first. Returns the ranked questions; raises
+    ValueError when there are none or units still miss questions.
+    """
+    decoded_units = []
+    contexts = {}
+    sources = {}
+    context = None
+    chain = []
+    for call in plan.calls:
+        args = _turn_args(plan, call, context)
+        chain = chain + call.units if args['context'] else list(call.units)
+        _, context = generate_turn(call.prompt, syllabus=syllabus, **args)
+        decoded_units.extend(args['decoder'].units)
+        # Every unit of the conversation so far can be repaired from its latest context
+        contexts.update(dict.fromkeys(chain, context))
+        sources.update(dict.fromkeys(call.units, call))
+    unit_questions = _plan_questions(decoded_units, units, plan)
+    for call, context in repair_calls(plan, units, unit_questions, contexts, sources, repair_model):
+        args = _repair_args(plan, call, context, repair_model)
+        generate_turn(call.prompt, syllabus=syllabus, **args)
+        merge_repair(plan, unit_questions, units, call, args['decoder'].units)
+    check_unit_questions(unit_questions, plan.counts)
+    return unit_questions
+
+# Function: Generate the Questions of a Prompt Plan (asyncio)
+async def agenerate_unit_questions(client, plan, units, syllabus=None, repair_model=None):
+    decoded_units = []
+    contexts = {}
+    sources = {}
+    context = None
+    chain = []
+    for call in plan.calls:
+        args = _turn_args(plan, call, context)
+        chain = chain + call.units if args['context'] else list(call.units)
+        _, context = await agenerate_turn(client, call.prompt, syllabus=syllabus, **args)
+        decoded_units.extend(args['decoder'].units)
+        contexts.update(dict.fromkeys(chain, context))
+        sources.update(dict.fromkeys(call.units, call))
+    unit_questions = _plan_questions(decoded_units, units, plan)
+    for call, context in repair_calls(plan, units, unit_questions, contexts, sources, repair_model):
+        args = _repair_args(plan, call, context, repair_model)
+        await agenerate_turn(client, call.prompt, syllabus=syllabus, **args)
+        merge_repair(plan, unit_questions, units, call, args['decoder'].units)
+    check_unit_questions(unit_questions, plan.counts)
+    return unit_questions
+
+def _distribution(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        'mean': round(sum(values) / len(values), 2),
+        'p50': round(values[len(values) // 2], 2),
+        'p95': round(values[min(len(values) - 1, int(0.95 * len(values)))], 2),
+        'max': round(values[-1], 2),
+    }
+
+# Function: Summarize Stored Generation Stats per Model
+def summarize_generation_stats(rows):
+    """
+    Group generation_stats rows by model and report generation speed (tokens/sec),
+    prompt-eval cost and the distribution of prompt and output sizes.
+    """
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(row['model'], []).append(row)
+
+    summary = {}
+    for model, model_rows in by_model.items():
+        summary[model] = {
+            'generations': len(model_rows),
+            'tokens_per_second': _distribution([
+                row['eval_count'] / row['eval_duration'] * 1e9
+                for row in model_rows if row['eval_count'] and row['eval_duration']
+            ]),
+            'prompt_tokens_per_second': _distribution([
+                row['prompt_eval_count'] / row['prompt_eval_duration'] * 1e9
+                for row in model_rows if row['prompt_eval_count'] and row['prompt_eval_duration']
+            ]),
+            'prompt_eval_seconds': _distribution([
+                row['prompt_eval_duration'] / 1e9 for row in model_rows if row['prompt_eval_duration']
+            ]),
+            'prompt_tokens': _distribution([row['prompt_eval_count'] for row in model_rows if row['prompt_eval_count']]),
+            'output_tokens': _distribution([row['eval_count'] for row in model_rows if row['eval_count']]),
+            'total_seconds': _distribution([row['total_duration'] / 1e9 for row in model_rows if row['total_duration']]),
+        }
+    return summary
@@ -0,0 +1,131 @@
+import logging
+import numpy as np
+from question_pipeline import RANK_WEIGHT_DECAY
+
+logger = logging.getLogger(__name__)
+
+# Questions picked per unit for every paper (marks -> count)
+DEFAULT_PICKS = {'4': 1, '6': 1}
+
+# Function: Build the question-index buckets for a bank
+def build_buckets(unit_questions, picks=None):
+    """
+    Flatten the bank into (unit, marks, questions, offset, count) buckets so every
+    question gets a global column index in the incidence matrix.
+    """
+    picks = picks or DEFAULT_PICKS
+    buckets = []
+    offset = 0
+    for unit, marks_dict in unit_questions.items():
+        for marks, count in picks.items():
+            questions = marks_dict.get(marks, [])
+            if len(questions) < count:
+                raise ValueError(
+                    f"Unit '{unit}' has {len(questions)} {marks}-mark questions, {count} needed per paper."
+                )
+            if count:
+                buckets.append((unit, marks, questions, offset, count))
+            offset += len(questions)
+    return buckets, offset
+
+# Function: Draw random candidate papers as an incidence matrix
+def draw_candidates(rng, buckets, total_questions, num_candidates, decay=RANK_WEIGHT_DECAY):
+    """
+    Return a (num_candidates x total_questions) 0/1 matrix, one row per candidate paper.
+    Each bucket position i is weighted decay ** i (banked best first, as in select_questions).
+    """
+    candidates = np.zeros((num_candidates, total_questions), dtype=np.int32)
+    rows = np.arange(num_candidates)[:, None]
+    for _, _, questions, offset, count in buckets:
+        # The top `count` of log-weight plus Gumbel noise is a weighted sample without replacement per row
+        noise = rng.gumbel(size=(num_candidates, len(questions)))
+        keys = np.arange(len(questions)) * np.log(decay) + noise
+        picked = np.argsort(-keys, axis=1)[:, :count]
+        candidates[rows, picked + offset] = 1
+    return candidates
+
+# Function: Generate N papers with a bounded pairwise overlap
+def generate_paper_batch(unit_questions, num_papers, max_overlap, picks=None, seed=None, max_rounds=50):
+    """
+    Pick questions for `num_papers` papers so that no two papers share more than
+    `max_overlap` questions. Returns a list of {unit: {marks: [question, ...]}} dicts
+    in the shape generate_pdf expects.
+    """
+    if num_papers < 1:
+        raise ValueError("Number of papers must be at least 1.")
+    if max_overlap < 0:
+        raise ValueError("Maximum overlap cannot be negative.")
+
+    buckets, total_questions = build_buckets(unit_questions, picks)
+    if not buckets:
+        raise ValueError("No questions available to build papers.")
+
+    rng = np.random.default_rng(seed)
+    accepted = np.zeros((0, total_questions), dtype=np.int32)
+
+    for round_num in range(max_rounds):
+        needed = num_papers - len(accepted)
+        if needed <= 0:
+            break
+
+        # The rank weighting flattens round by round, so tight overlap bounds can still reach
+        # the lower-ranked questions
+        decay = RANK_WEIGHT_DECAY ** (1 - round_num / max_rounds)
+        candidates = draw_candidates(rng, buckets, total_questions, max(4 * needed, 64), decay)
+
+        # Drop candidates that overlap too much with papers already accepted
+        if len(accepted):
+            fits = (candidates @ accepted.T).max(axis=1) <= max_overlap
+            candidates = candidates[fits]
+
+        # Greedily keep candidates that are also compatible with each other
+        clashes = (candidates @ candidates.T) > max_overlap
+        kept = []
+        for i in range(len(candidates)):
+            if not clashes[i, kept].any():
+                kept.append(i)
+                if len(kept) == needed:
+                    break
+
+        accepted = np.vstack([accepted, candidates[kept]])
+        logger.debug("Paper batch round %d: accepted %d/%d papers.", round_num + 1, len(accepted), num_papers)
+
+    if len(accepted) < num_papers:
+        raise ValueError(
+            f"Could only build {len(accepted)} of {num_papers} papers with at most "
+            f"{max_overlap} shared questions. Add questions to the bank or raise the overlap limit."
+        )
+
+    return [papers_from_row(row, buckets) for row in accepted[:num_papers]]
+
+# Function: Convert an incidence row back into a paper
+def papers_from_row(row, buckets):
+    paper_questions = {}
+    for unit, marks, questions, offset, _ in buckets:
+        chosen = np.flatnonzero(row[offset:offset + len(questions)])
+        paper_questions.setdefault(unit, {'4': [], '6': []})
+        paper_questions[unit].setdefault(marks, []).extend(questions[i] for i in chosen)
+    return paper_questions
+
+# Function: Largest number of questions any two papers share
+def max_pairwise_overlap(papers):
+    """
+    Compute the maximum number of questions shared by any pair of papers (for checks and logging).
+    """
+    if len(papers) < 2:
+        return 0
+    keys = {}
+    rows = []
+    for paper in papers:
+        row = set()
+        for unit, marks_dict in paper.items():
+            for marks, questions in marks_dict.items():
+                for question in questions:
+                    row.add(keys.setdefault((unit, marks, question['text']), len(keys)))
+        rows.append(row)
+    matrix = np.zeros((len(rows), len(keys)), dtype=np.int32)
+    for i, row in enumerate(rows):
+        matrix[i, list(row)] = 1
+    overlap = matrix @ matrix.T
+    np.fill_diagonal(overlap, 0)
+    return int(overlap.max())
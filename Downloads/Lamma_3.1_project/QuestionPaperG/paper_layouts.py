@@ -0,0 +1,97 @@
+from functools import lru_cache
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.platypus import TableStyle
+
+# Layout definitions. Each one is compiled once per process by get_layout() and the
+# resulting styles, column widths and table commands are shared by every paper.
+LAYOUTS = {
+    'exam-table': {
+        'columns': ['Question No', 'Subquestion', 'Question Text', 'CO', 'BT', 'Marks'],
+        'col_widths': [80, 60, 300, 40, 40, 40],
+        'table_commands': [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ],
+        # Alternate data rows (even rows first), leaving unit separators and every 7th row plain
+        'band_colors': (colors.lightgrey, colors.whitesmoke),
+        'band_skip_every': 7,
+    },
+    'custom-table': {
+        'columns': ['Unit', 'Marks', 'Question'],
+        'col_widths': [100, 50, 300],
+        'table_commands': [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ],
+        'band_colors': None,
+        'band_skip_every': None,
+    },
+}
+
+class CompiledLayout:
+    """
+    Styles, column widths and table commands for one layout, built once and reused.
+    """
+    def __init__(self, name, spec):
+        self.name = name
+        self.columns = spec['columns']
+        self.col_widths = spec['col_widths']
+        self.band_colors = spec['band_colors']
+        self.band_skip_every = spec['band_skip_every']
+
+        self.styles = getSampleStyleSheet()
+        self.main_title_style = ParagraphStyle(
+            name='MainTitle',
+            parent=self.styles['Heading1'],
+            alignment=1,  # Center alignment
+            spaceAfter=12
+        )
+        self.header_style = ParagraphStyle(
+            name='TableHeader',
+            parent=self.styles['Normal'],
+            fontName='Helvetica-Bold',
+            fontSize=10,
+            alignment=1,  # Center alignment
+            textColor=colors.whitesmoke
+        )
+        self.table_commands = list(spec['table_commands'])
+        self.base_table_style = TableStyle(self.table_commands)
+
+    def table_style(self, blank_rows, num_rows):
+        """
+        Return the complete TableStyle (base commands plus row banding) for a table,
+        so it is applied with a single setStyle call.
+        """
+        if not self.band_colors:
+            return self.base_table_style
+        return self._banded_style(tuple(blank_rows), num_rows)
+
+    @lru_cache(maxsize=64)
+    def _banded_style(self, blank_rows, num_rows):
+        # Papers in a batch share their row structure, so this is computed once per shape
+        blank = set(blank_rows)
+        even_color, odd_color = self.band_colors
+        commands = list(self.table_commands)
+        for i in range(1, num_rows):
+            if i in blank or (self.band_skip_every and i % self.band_skip_every == 0):
+                continue
+            bg_color = even_color if i % 2 == 0 else odd_color
+            commands.append(('BACKGROUND', (0, i), (-1, i), bg_color))
+        return TableStyle(commands)
+
+# Function: Get a Compiled Layout by Name
+@lru_cache(maxsize=None)
+def get_layout(name):
+    if name not in LAYOUTS:
+        raise ValueError(f"Unknown layout template: {name}")
+    return CompiledLayout(name, LAYOUTS[name])
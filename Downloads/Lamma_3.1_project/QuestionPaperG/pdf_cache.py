@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from artifacts import staging_path, commit_artifact
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed cache of rendered question papers
+PDF_CACHE_DIR = os.environ.get('QP_PDF_CACHE_DIR', os.path.join('cache', 'pdf'))
+PDF_CACHE_QUOTA_BYTES = int(os.environ.get('QP_PDF_CACHE_QUOTA_MB', 200)) * 1024 * 1024
+# Seconds after which the cache directory is rescanned even below the quota, to pick up
+# entries other processes added
+EVICT_INTERVAL_SECONDS = 300
+# Share of the quota an eviction trims the cache down to, so the next misses do not scan again
+EVICT_LOW_WATER = 0.9
+
+# This process's estimate of the cache size (None until the first scan) and when it last scanned
+_cache_size = None
+_last_scan = 0.0
+
+# Function: Hash a Question Selection
+def selection_key(unit_questions, template, header=None):
+    """
+    Build the cache key from the ordered question IDs, the layout template name and
+    the header metadata. Accepts both {unit: [questions]} and {unit: {marks: [questions]}}.
+    """
+    selection = []
+    for unit, questions in unit_questions.items():
+        if isinstance(questions, dict):
+            questions = [q for marks in questions.values() for q in marks]
+        for question in questions:
+            # Questions that never went through the database fall back to their text
+            selection.append([unit, question.get('id', question['text']), str(question['marks'])])
+    payload = json.dumps(
+        {'template': template, 'header': header or {}, 'questions': selection},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cached_pdf_path(key):
+    return os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+
+# Function: Look Up a Cached PDF
+def get_cached_pdf(key):
+    path = cached_pdf_path(key)
+    try:
+        os.utime(path)  # Touch so eviction treats it as recently used
+    except FileNotFoundError:
+        return None
+    return path
+
+# Function: Place a File at `filepath` Without Copying When Possible
+def link_or_copy(src, filepath):
+    if os.path.exists(filepath) and os.path.samefile(src, filepath):
+        return  # Already linked to this cache entry
+    tmp_filepath = staging_path(filepath)
+    try:
+        try:
+            os.link(src, tmp_filepath)
+        except OSError:
+            with open(src, 'rb') as source, open(tmp_filepath, 'wb') as target:
+                target.write(source.read())
+        commit_artifact(tmp_filepath, filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+# Function: Render Through the Cache
+def render_with_cache(key, render, filepath):
+    """
+    Put the PDF for `key` at `filepath`. On a hit the cached file is linked into place
+    and `render` is never called; on a miss `render(path)` builds it into the cache first.
+    Returns True on a cache hit.
+    """
+    cached = get_cached_pdf(key)
+    if cached:
+        link_or_copy(cached, filepath)
+        logger.debug("PDF cache hit for %s.", key)
+        return True
+
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    path = cached_pdf_path(key)
+    tmp_path = staging_path(path)
+    try:
+        render(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    link_or_copy(path, filepath)
+    logger.debug("PDF cache miss for %s; rendered and stored.", key)
+    note_cache_write(os.path.getsize(path))
+    return False
+
+# Function: Store a PDF Rendered in Memory
+def store_cached_pdf(key, pdf_bytes):
+    """
+    Write `pdf_bytes` as the cache entry for `key` (atomically, like render_with_cache)
+    and return its path.
+    """
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    path = cached_pdf_path(key)
+    tmp_path = staging_path(path)
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(pdf_bytes)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.debug("Stored an in-memory render as %s.", key)
+    note_cache_write(len(pdf_bytes))
+    return path
+
+# Function: Evict Only When the Cache May Be Over Its Quota
+def note_cache_write(size):
+    """
+    Add a new entry to the running size estimate and scan the directory only once the
+    estimate crosses the quota or the last scan is EVICT_INTERVAL_SECONDS old.
+    """
+    global _cache_size
+    if _cache_size is not None:
+        _cache_size += size
+        if _cache_size <= PDF_CACHE_QUOTA_BYTES and time.time() - _last_scan < EVICT_INTERVAL_SECONDS:
+            return 0
+    return evict_pdf_cache()
+
+# Function: Evict Least Recently Used PDFs Over the Disk Quota
+def evict_pdf_cache(quota_bytes=None):
+    global _cache_size, _last_scan
+    quota_bytes = PDF_CACHE_QUOTA_BYTES if quota_bytes is None else quota_bytes
+    entries = []
+    total = 0
+    try:
+        with os.scandir(PDF_CACHE_DIR) as it:
+            for entry in it:
+                if entry.name.endswith('.pdf'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    target = quota_bytes * EVICT_LOW_WATER if total > quota_bytes else quota_bytes
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Another worker evicted it first
+        total -= size
+        removed += 1
+    _cache_size = total
+    _last_scan = time.time()
+    if removed:
+        logger.info("Evicted %s PDFs from the cache to stay under %s bytes.", removed, quota_bytes)
+    return removed
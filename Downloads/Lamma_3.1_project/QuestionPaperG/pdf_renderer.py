@@ -0,0 +1,279 @@
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+from pdf_cache import selection_key, render_with_cache
+from artifacts import staging_path, commit_artifact
+from paper_layouts import get_layout
+from metrics import timed_stage, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Number of render processes (defaults to one per CPU)
+RENDER_WORKERS = int(os.environ.get('QP_RENDER_WORKERS', os.cpu_count() or 1))
+
+# Number of batches whose futures this process keeps for wait_for_render_batch
+MAX_TRACKED_BATCHES = 256
+
+# Written next to a batch's papers: the file names it will hold, so any worker can report
+# its progress from disk
+BATCH_MANIFEST = 'batch.json'
+# Suffix of the marker left next to a paper whose render failed
+FAILED_SUFFIX = '.failed'
+
+# Layout name and header lines printed on every paper (both feed the render cache key)
+PAPER_TEMPLATE = 'exam-table'
+PAPER_HEADER = {
+    'title': "Exam Question Paper",
+    'course': "Course: Data Communications",
+    'instructor': "Instructor: Dr. Jane Doe",
+    'date': "Date: 23-Nov-2024",
+}
+
+CO_PATTERN = re.compile(r'\[CO:(\d+)\]')
+BT_PATTERN = re.compile(r'\[BT:(\d+)\]')
+CO_BT_TAGS_PATTERN = re.compile(r'\[CO:\d+\]\s*\[BT:\d+\]')
+
+_render_pool = None
+_render_batches = OrderedDict()
+
+# Function: Split CO/BT Tags off a Question
+def split_question_tags(text):
+    """
+    Return (clean_text, co, bt) for a stored question, with 'N/A' for missing tags.
+    """
+    co_match = CO_PATTERN.search(text)
+    bt_match = BT_PATTERN.search(text)
+    co = co_match.group(1) if co_match else 'N/A'
+    bt = bt_match.group(1) if bt_match else 'N/A'
+    # Remove [CO:X] and [BT:Y] from the question text for clarity in the table
+    return CO_BT_TAGS_PATTERN.sub('', text).strip(), co, bt
+
+# Function: Generate PDF from Questions in Table Format
+@timed_stage('generate_pdf')
+def generate_pdf(unit_questions, filepath):
+    try:
+        doc = SimpleDocTemplate(filepath, pagesize=letter)
+        layout = get_layout(PAPER_TEMPLATE)
+        normal_style = layout.styles['Normal']
+
+        # Add Main Titles at the Top
+        elements = [
+            Paragraph(PAPER_HEADER['title'], layout.main_title_style),
+            Paragraph(PAPER_HEADER['course'], layout.styles['Heading2']),
+            Paragraph(PAPER_HEADER['instructor'], normal_style),
+            Paragraph(PAPER_HEADER['date'], normal_style),
+            Spacer(1, 24),
+        ]
+
+        # Define table data with headers
+        table_data = [[Paragraph(column, layout.header_style) for column in layout.columns]]
+        blank_rows = []
+
+        # Initialize question number
+        question_num = 1
+
+        for unit, questions in unit_questions.items():
+            # Papers already carry the selected questions for each unit
+            selected_questions = questions['4'] + questions['6']
+
+            for idx, question in enumerate(selected_questions):
+                sub_label = chr(97 + idx)  # 'a', 'b'
+                question_text_clean, co, bt = split_question_tags(question['text'])
+
+                table_data.append([
+                    Paragraph(f"{question_num}{sub_label}", normal_style),  # Question No (e.g., '1a')
+                    sub_label,                                             # Subquestion ('a', 'b')
+                    Paragraph(question_text_clean, normal_style),
+                    co,
+                    bt,
+                    str(question['marks'])
+                ])
+
+            # Add a blank row after each unit for differentiation
+            blank_rows.append(len(table_data))
+            table_data.append(['', '', '', '', '', ''])
+
+            question_num += 1  # Increment main question number for next unit
+
+        # Base style and row banding come precompiled from the layout in one TableStyle
+        table = Table(table_data, colWidths=layout.col_widths, repeatRows=1)
+        table.setStyle(layout.table_style(blank_rows, len(table_data)))
+
+        elements.append(table)
+        elements.append(Spacer(1, 24))  # Space after the table
+
+        # Build the PDF
+        doc.build(elements)
+        logger.debug("PDF generated at: %s", filepath)
+    except Exception as e:
+        logger.exception("Failed to generate PDF: %s", filepath)
+        raise
+
+# Function: Generate the Custom (Unit/Marks/Question) Paper
+@timed_stage('generate_pdf')
+def generate_custom_pdf(unit_questions, filepath):
+    try:
+        logger.debug("Generating PDF for question paper.")
+        doc = SimpleDocTemplate(filepath, pagesize=letter)
+        layout = get_layout("custom-table")
+        elements = []
+
+        # Add title
+        title = Paragraph("Custom Question Paper", layout.styles["Heading1"])
+        elements.append(title)
+        elements.append(Spacer(1, 12))
+
+        # Add table for questions
+        table_data = [list(layout.columns)]
+        for unit, questions in unit_questions.items():
+            for question in questions:
+                table_data.append([unit, question["marks"], question["text"]])
+
+        table = Table(table_data, colWidths=layout.col_widths)
+        table.setStyle(layout.base_table_style)
+        elements.append(table)
+        doc.build(elements)
+        logger.debug("PDF generated successfully: %s", filepath)
+    except Exception as e:
+        logger.exception("Failed to generate PDF.")
+        raise
+
+
+# Function: Render a Custom Paper to Bytes (runs inside a pool process)
+def render_custom_pdf_bytes(unit_questions):
+    buffer = io.BytesIO()
+    generate_custom_pdf(unit_questions, buffer)
+    return buffer.getvalue()
+
+# Function: Render One Paper Atomically (runs inside a pool process)
+def render_paper(paper_questions, filepath):
+    """
+    Render a paper into the PDF cache (or reuse an identical cached selection) and
+    rename it into place at `filepath`, so readers never see a half-written PDF.
+    Returns (seconds taken, whether the cache already held it).
+    """
+    start = time.perf_counter()
+    key = selection_key(paper_questions, PAPER_TEMPLATE, PAPER_HEADER)
+    try:
+        cache_hit = render_with_cache(key, lambda path: generate_pdf(paper_questions, path), filepath)
+    except Exception as e:
+        # Leave the failure on disk for status polls served by other workers
+        with open(filepath + FAILED_SUFFIX, 'w', encoding='utf-8') as marker:
+            marker.write(str(e))
+        raise
+    return time.perf_counter() - start, cache_hit
+
+# Function: Shared Process Pool for Rendering
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        if multiprocessing.current_process().daemon:
+            # Daemonic workers (e.g. hypercorn --workers N) may not fork children
+            _render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+            logger.warning("Running in a daemonic process; PDF render pool uses %s threads.", RENDER_WORKERS)
+        else:
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+            logger.info("Started PDF render pool with %s workers.", RENDER_WORKERS)
+    return _render_pool
+
+def shutdown_render_pool(wait_for_jobs=True):
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=wait_for_jobs)
+        _render_pool = None
+
+# Function: Fan a Batch of Papers Out Across the Pool
+def submit_render_batch(papers_questions, output_dir, filename_pattern='question_paper_{}.pdf', batch_id=None):
+    """
+    Queue every paper for rendering and return the batch id (a fresh one unless given).
+    Papers are numbered from 1. The batch manifest is written to `output_dir` first, so
+    render_batch_status(output_dir) works from any process.
+    """
+    pool = get_render_pool()
+    batch_id = batch_id or uuid.uuid4().hex
+    filenames = [filename_pattern.format(paper_num) for paper_num in range(1, len(papers_questions) + 1)]
+    write_batch_manifest(output_dir, batch_id, filenames)
+    jobs = []
+    for filename, paper_questions in zip(filenames, papers_questions):
+        filepath = os.path.join(output_dir, filename)
+        future = pool.submit(render_paper, paper_questions, filepath)
+        if isinstance(pool, ProcessPoolExecutor):
+            # generate_pdf's own timing stays in the render process, so record it here;
+            # in the thread pool fallback it is already recorded in this process
+            future.add_done_callback(observe_render)
+        jobs.append((filename, future))
+    _render_batches[batch_id] = (output_dir, jobs)
+    while len(_render_batches) > MAX_TRACKED_BATCHES:
+        _render_batches.popitem(last=False)
+    logger.info("Submitted render batch %s with %s papers.", batch_id, len(jobs))
+    return batch_id
+
+def write_batch_manifest(output_dir, batch_id, filenames):
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST)
+    staged_path = staging_path(manifest_path)
+    with open(staged_path, 'w', encoding='utf-8') as manifest:
+        json.dump({'batch_id': batch_id, 'papers': filenames}, manifest)
+    commit_artifact(staged_path, manifest_path)
+
+def observe_render(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    seconds, cache_hit = future.result()
+    if not cache_hit:
+        observe_stage('generate_pdf', seconds)
+
+# Function: Wait for the First Papers of a Batch
+def wait_for_render_batch(batch_id, min_ready=1, timeout=None):
+    """
+    Block until at least `min_ready` papers of the batch are finished (or all of them
+    if `min_ready` is None), then return the batch status with this process's render times.
+    """
+    output_dir, jobs = _render_batches[batch_id]
+    target = len(jobs) if min_ready is None else min(min_ready, len(jobs))
+    pending = {future for _, future in jobs}
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while len(jobs) - len(pending) < target and pending:
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        _, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+    status = render_batch_status(output_dir)
+    status['render_seconds'] = {}
+    for filename, future in jobs:
+        if future.done() and future.exception() is None:
+            status['render_seconds'][filename] = round(future.result()[0], 4)
+        elif future.done():
+            logger.error("Rendering %s failed: %s", filename, future.exception())
+    return status
+
+# Function: Report Batch Progress
+def render_batch_status(output_dir):
+    """
+    Return the ready/pending/failed papers of the batch rendered into `output_dir`, read
+    from its manifest and the files on disk (so any worker can answer), or None when the
+    directory holds no batch.
+    """
+    try:
+        with open(os.path.join(output_dir, BATCH_MANIFEST), encoding='utf-8') as manifest:
+            batch = json.load(manifest)
+    except FileNotFoundError:
+        return None
+    status = {'batch_id': batch['batch_id'], 'papers': [], 'pending': [], 'failed': []}
+    for filename in batch['papers']:
+        filepath = os.path.join(output_dir, filename)
+        if os.path.exists(filepath):
+            status['papers'].append(filename)
+        elif os.path.exists(filepath + FAILED_SUFFIX):
+            status['failed'].append(filename)
+        else:
+            status['pending'].append(filename)
+    return status
@@ -0,0 +1,184 @@
+import functools
+import logging
+import math
+import os
+import random
+import re
+from collections import namedtuple
+import PyPDF2
+from metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+# Questions each unit must end up with, by marks
+QUESTIONS_PER_UNIT = {'4': 3, '6': 3}
+# Candidates asked for per bucket, as a multiple of the questions it needs (1 disables
+# over-generation); the best are kept first and the surplus is banked behind them
+OVERGENERATION_FACTOR = float(os.environ.get('QP_OVERGENERATION_FACTOR', 1.5))
+# Weight of each bucket position relative to the one before it when papers sample questions
+# (buckets are banked best first, so lower weights favour the top; 1 samples uniformly)
+RANK_WEIGHT_DECAY = float(os.environ.get('QP_RANK_WEIGHT_DECAY', 0.7))
+
+# Unit headings: a line starting with "Unit <n>" (whitespace may not run across lines)
+UNIT_HEADING_PATTERN = re.compile(r'^Unit[^\S\n]+\d+.*', re.IGNORECASE | re.MULTILINE)
+# Texts whose unit index is kept (keyed by the extracted text itself)
+UNIT_INDEX_CACHE_SIZE = 64
+
+# One unit of a syllabus: its id ("Unit 3"), heading line and [start, end) character offsets
+UnitSpan = namedtuple('UnitSpan', 'unit_id title start_offset end_offset')
+
+MARKS_NAMES = {'4': 'four-mark', '6': 'six-mark'}
+
+# Function: System Prompt for Generating the Given Questions per Unit
+def build_system_prompt(counts=QUESTIONS_PER_UNIT):
+    """
+    The generation instructions for `counts` ({marks: questions per unit}); the default
+    asks for every bucket, a single bucket is used when buckets go to different models.
+    """
+    total = sum(counts.values())
+    kinds = ' and '.join(f"{count} {MARKS_NAMES[marks]} questions" for marks, count in counts.items())
+    example_marks = ', '.join(f'{{"text": "Question text", "marks": {marks}, "co": X, "bt": Y}}' for marks in counts)
+    return (
+        "As an AI assistant, your task is to generate exam questions from the provided text. "
+        f"For each unit listed in the 'Units' section below, you must generate exactly {total} questions: "
+        f"{kinds}. "
+        "Do not generate more or fewer questions for any unit. "
+        "Each question should be relevant to the corresponding unit and cover key concepts. "
+        "Answer with a JSON object that has one entry per unit in \"units\", in this shape:\n\n"
+        f'{{"units": [{{"unit": "Unit X", "questions": [{example_marks}, ...]}}, ...]}}\n\n'
+        "Important Guidelines:\n"
+        "- **Unit:** \"unit\" is the unit exactly as listed in the 'Units' section (for example \"Unit 1\").\n"
+        "- **CO Number Must Match Unit Number:** For each question, \"co\" must be the same as the unit number. For example, questions in Unit 1 must have \"co\": 1.\n"
+        "- **Bloom's Taxonomy (BT):** \"bt\" should be a Bloom's Taxonomy level between 1 and 6, appropriate for the question.\n"
+        "- **Question Text Only:** \"text\" holds only the question; do not repeat the marks, CO or BT in it.\n"
+        f"- **Correct Marks:** \"marks\" is {' or '.join(counts)}, matching the difficulty of the question.\n"
+        "- **Do Not Omit Anything:** Do not omit any units or questions.\n"
+        "- **Strict Adherence:** Adhere strictly to the format and guidelines without deviation."
+    )
+
+# System prompt for AI model
+SYSTEM_PROMPT = build_system_prompt()
+
+# Function: Extract Text from PDF
+@timed_stage('extract_text')
+def extract_text_from_pdf(filepath):
+    try:
+        text = ''
+        with open(filepath, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            for page in reader.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    text += page_text + '\n'
+        return text
+    except Exception as e:
+        logger.exception("Failed to extract text from PDF.")
+        raise
+
+# Function: Index the Units of a Text in One Pass
+@functools.lru_cache(maxsize=UNIT_INDEX_CACHE_SIZE)
+def get_unit_index(syllabus_text):
+    # A tuple of UnitSpans in text order (shared by every caller through the cache)
+    matches = list(UNIT_HEADING_PATTERN.finditer(syllabus_text))
+    spans = []
+    for i, match in enumerate(matches):
+        title = match.group().strip()
+        end_offset = matches[i + 1].start() if i + 1 < len(matches) else len(syllabus_text)
+        spans.append(UnitSpan(title.split(':')[0].strip(), title, match.start(), end_offset))
+    return tuple(spans)
+
+# Function: Extract Units from Text
+@timed_stage('extract_units')
+def extract_units_from_text(syllabus_text):
+    # A unit id repeated later in the text keeps its last heading, as before
+    return {span.unit_id: span.title for span in get_unit_index(syllabus_text)}
+
+# Function: Build the Generation Prompt (SYSTEM_PROMPT is sent separately as `system`)
+def build_prompt(units, syllabus_text, reference_text=None):
+    units_text = '\n'.join(units.keys())
+    prompt = f"Units:\n{units_text}\n\nText:\n{syllabus_text}"
+    if reference_text:
+        prompt += f"\n\nReference material:\n{reference_text}"
+    return prompt
+
+# Function: Follow-up Prompt for Units Missing Questions
+def build_repair_prompt(unit_ids, counts=QUESTIONS_PER_UNIT):
+    units_text = '\n'.join(unit_ids)
+    kinds = ' and '.join(f"{count} {MARKS_NAMES[marks]}" for marks, count in counts.items())
+    return (
+        f"Some units in your answer do not have exactly {kinds} questions. "
+        f"Write all {sum(counts.values())} questions again for only these units, in the same format.\n\n"
+        f"Units:\n{units_text}"
+    )
+
+def requested_counts(counts=QUESTIONS_PER_UNIT):
+    return {marks: max(count, math.ceil(count * OVERGENERATION_FACTOR)) for marks, count in counts.items()}
+
+# Function: Sample Bucket Positions Weighted Toward the Best-Ranked
+def rank_weighted_sample(rng, size, count):
+    """
+    Pick `count` distinct positions out of `size`, position i weighted RANK_WEIGHT_DECAY ** i.
+    """
+    positions = list(range(size))
+    weights = [RANK_WEIGHT_DECAY ** i for i in positions]
+    picks = []
+    for _ in range(count):
+        i = rng.choices(range(len(positions)), weights)[0]
+        picks.append(positions.pop(i))
+        weights.pop(i)
+    return picks
+
+# Function: Units Missing Questions
+def find_incomplete_units(unit_questions, counts=QUESTIONS_PER_UNIT):
+    incomplete_units = []
+    for unit, questions in unit_questions.items():
+        if any(len(questions.get(marks, [])) < count for marks, count in counts.items()):
+            incomplete_units.append(unit)
+            logger.error("Unit '%s' has %s four-mark questions and %s six-mark questions.", unit, len(questions['4']), len(questions['6']))
+    return incomplete_units
+
+def check_unit_questions(unit_questions, counts=QUESTIONS_PER_UNIT):
+    incomplete_units = find_incomplete_units(unit_questions, counts)
+    if incomplete_units:
+        raise ValueError(f"Units {incomplete_units} do not have the required number of questions.")
+
+# Function: Pick the Questions of a Custom Paper Spec
+def select_questions(data, all_questions):
+    """
+    Validate a question paper spec ({'total_marks', 'unit_details'}, optionally 'syllabus'
+    and 'seed') and pick its questions from `all_questions` ({unit: {marks: [question, ...]}}),
+    the bank of the spec's syllabus. Questions are sampled from the whole bucket weighted
+    toward its best-ranked ones (rank_weighted_sample), so refilled ones still get used; the
+    same seed picks the same questions (and so hits the PDF cache).
+    Returns (unit_questions, None) or (None, error_message).
+    """
+    total_marks = data.get('total_marks')
+    unit_details = data.get('unit_details', [])
+    if not total_marks or not unit_details:
+        return None, "Total marks and unit details are required."
+
+    # Validate that marks match the total
+    calculated_marks = sum(
+        sum(q_count * int(q_marks) for q_marks, q_count in unit['questions'].items())
+        for unit in unit_details
+    )
+    if calculated_marks != total_marks:
+        return None, f"Total marks mismatch. Expected {total_marks}, got {calculated_marks}"
+
+    rng = random.Random(data.get('seed'))
+    unit_questions = {}
+    for unit in unit_details:
+        unit_name = unit['unit']
+        if unit_name not in all_questions:
+            bank = f"syllabus '{data['syllabus']}'" if data.get('syllabus') else "the uploaded syllabus"
+            return None, f"No questions stored for unit '{unit_name}' in {bank}. Generate questions for it first."
+        questions = []
+        for q_marks, q_count in unit['questions'].items():
+            bucket = all_questions[unit_name].get(str(q_marks), [])
+            if len(bucket) < q_count:
+                return None, f"Not enough questions for {q_marks}-mark in Unit {unit_name}. Requested {q_count}."
+            # A rank-weighted sample of the bucket, listed in bank order
+            picks = sorted(rank_weighted_sample(rng, len(bucket), q_count))
+            questions.extend(bucket[i] for i in picks)
+        unit_questions[unit_name] = questions
+    return unit_questions, None
@@ -0,0 +1,87 @@
+import logging
+import re
+from question_pipeline import QUESTIONS_PER_UNIT
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+TAG_PATTERN = re.compile(r'\[(?:CO|BT):(\d+)\]')
+BT_PATTERN = re.compile(r'\[BT:(\d+)\]')
+
+# Bloom's levels that suit each marks value (short recall questions for 4 marks,
+# application and above for 6); other levels are kept but rank lower
+PREFERRED_BT = {'4': {1, 2, 3}, '6': {3, 4, 5, 6}}
+# Question length in words (tags excluded) outside which a candidate ranks lower
+MIN_WORDS, MAX_WORDS = 6, 45
+# Share of words two questions may have in common before the later one is a near-duplicate
+DUPLICATE_OVERLAP = 0.8
+
+def question_words(question):
+    return set(WORD_PATTERN.findall(TAG_PATTERN.sub('', question['text']).lower()))
+
+def question_bt(question):
+    match = BT_PATTERN.search(question['text'])
+    return int(match.group(1)) if match else None
+
+def _overlap(words, other):
+    return len(words & other) / len(words | other) if words or other else 1.0
+
+def base_score(question, marks, words):
+    score = 1.0
+    if not MIN_WORDS <= len(words) <= MAX_WORDS:
+        score -= 0.5
+    if question_bt(question) in PREFERRED_BT.get(marks, ()):
+        score += 0.5
+    return score
+
+# Function: Order the Candidates of One Bucket Best First
+def rank_bucket(questions, marks):
+    """
+    Greedy ranking: each step picks the candidate with the best base score, less its word
+    overlap with the questions already picked, plus a bonus when its BT level is new to the
+    bucket. Near-duplicates of a picked question are dropped.
+    """
+    candidates = [(question, question_words(question)) for question in questions]
+    scores = [base_score(question, marks, words) for question, words in candidates]
+    # Highest overlap of each candidate with the picked questions, updated after every pick
+    overlaps = [0.0] * len(candidates)
+    ranked = []
+    picked_bts = set()
+
+    def _score(i):
+        return scores[i] - overlaps[i] + (0.25 if question_bt(candidates[i][0]) not in picked_bts else 0.0)
+
+    while candidates:
+        best = max(range(len(candidates)), key=_score)
+        question, words = candidates.pop(best)
+        scores.pop(best)
+        if overlaps.pop(best) >= DUPLICATE_OVERLAP:
+            logger.debug("Dropping a near-duplicate %s-mark question: %s", marks, question['text'])
+            continue
+        ranked.append(question)
+        picked_bts.add(question_bt(question))
+        overlaps = [max(overlap, _overlap(words, other)) for overlap, (_, other) in zip(overlaps, candidates)]
+    return ranked
+
+# Function: Drop Candidates That Repeat Questions Already in a Bucket
+def drop_near_duplicates(questions, existing):
+    seen = [question_words(question) for question in existing]
+    kept = []
+    for question in questions:
+        words = question_words(question)
+        if all(_overlap(words, other) < DUPLICATE_OVERLAP for other in seen):
+            kept.append(question)
+            seen.append(words)
+    return kept
+
+# Function: Rank Every Bucket of Generated Questions
+def rank_unit_questions(unit_questions, counts=QUESTIONS_PER_UNIT):
+    """
+    Order each unit's buckets best first, in place, dropping near-duplicates. The whole
+    bucket is banked in this order and papers sample it weighted by position
+    (question_pipeline.RANK_WEIGHT_DECAY), so the best candidates are used most often.
+    """
+    for questions in unit_questions.values():
+        for marks in counts:
+            questions[marks] = rank_bucket(questions.get(marks, []), marks)
+    return unit_questions
@@ -0,0 +1,159 @@
+"""
+Background refill of the question bank: keeps every (unit, marks, BT level) bucket at a
+floor by generating more questions for a unit while Ollama is idle, so papers are drawn
+from a bank that is already deep enough and never wait on the LLM.
+
+    python refill_worker.py                        # scan every QP_REFILL_INTERVAL seconds
+    python refill_worker.py --once --floor 3       # a single pass (e.g. from cron)
+
+Run one worker per database, next to the app (serve.py's workers do not run it). Ollama
+counts as idle when no app, ingest or other process has a generation in flight and none
+ended in the last --idle seconds (the generation_activity table); a refill started during
+a quiet spell still runs to its end. Processes only record their generations there with
+QP_TRACK_GENERATION_ACTIVITY=1, so set it for the app and ingest wherever a worker runs. Only units whose section text was stored with their
+questions (unit_sources) can be refilled. The buckets watched for each marks value are
+the BT levels question_ranking.PREFERRED_BT names for it, and the output schema of a refill
+allows only the levels that are short. New questions are appended after the unit's
+existing ones, minus near-duplicates of them.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import ollama_client
+from database import init_db, store_questions, get_question_rows, get_unit_sources, get_generation_activity
+from question_pipeline import extract_units_from_text
+from question_ranking import question_bt, drop_near_duplicates, PREFERRED_BT
+from model_router import route_unit_questions
+from ollama_client import OllamaError
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Questions each watched (unit, marks, BT level) bucket should hold
+REFILL_FLOOR = int(os.environ.get('QP_REFILL_FLOOR', 2))
+# Seconds between scans of the bank
+REFILL_INTERVAL = float(os.environ.get('QP_REFILL_INTERVAL', 60))
+# Seconds without a foreground generation before the worker starts one
+REFILL_IDLE_SECONDS = float(os.environ.get('QP_REFILL_IDLE_SECONDS', 30))
+# Seconds before a refilled unit is refilled again; the model may not write every BT level,
+# so some buckets can stay below the floor
+REFILL_COOLDOWN = float(os.environ.get('QP_REFILL_COOLDOWN', 900))
+# Activity rows not updated for this long belong to processes that died mid-generation
+STALE_ACTIVITY_SECONDS = 3600
+
+# Function: The Bank Grouped by Syllabus and Unit
+def load_bank():
+    """
+    Return {(syllabus, unit): {marks: [question, ...]}} with every stored question.
+    """
+    bank = {}
+    for syllabus, unit, marks, question in get_question_rows():
+        bank.setdefault((syllabus, unit), {}).setdefault(str(marks), []).append({'text': question, 'marks': str(marks)})
+    return bank
+
+# Function: Questions Missing from the Watched Buckets of a Unit
+def bucket_deficits(unit_bank, floor):
+    """
+    Return {(marks, bt): questions below the floor} for the unit's watched buckets that
+    are short.
+    """
+    sizes = {}
+    for marks, questions in unit_bank.items():
+        for question in questions:
+            bucket = (marks, question_bt(question))
+            sizes[bucket] = sizes.get(bucket, 0) + 1
+    deficits = {}
+    for marks, levels in PREFERRED_BT.items():
+        for bt in levels:
+            if sizes.get((marks, bt), 0) < floor:
+                deficits[marks, bt] = floor - sizes.get((marks, bt), 0)
+    return deficits
+
+def target_levels(deficits):
+    # Ask only for the short levels of a marks value (any preferred level when none is short)
+    return {marks: sorted(bt for (deficit_marks, bt) in deficits if deficit_marks == marks) or sorted(levels)
+            for marks, levels in PREFERRED_BT.items()}
+
+def ollama_idle(idle_seconds):
+    now = time.time()
+    in_flight, last_activity = get_generation_activity(now - STALE_ACTIVITY_SECONDS)
+    return not in_flight and now - (last_activity or 0) >= idle_seconds
+
+# Function: Generate More Questions for One Unit
+def refill_unit(syllabus, unit, section, unit_bank, bt_levels=None):
+    """
+    Generate the unit again from its stored section, restricted to `bt_levels`, and append
+    the questions that do not repeat its bank. Returns the number of questions stored.
+    """
+    units = {unit_id: title for unit_id, title in extract_units_from_text(section).items() if title == unit}
+    if not units:
+        logger.warning("No unit heading for %s in its stored section; skipping.", unit)
+        return 0
+    unit_questions, _ = route_unit_questions(units, section, syllabus=syllabus, bt_levels=bt_levels)
+    fresh = {unit: {
+        marks: drop_near_duplicates(questions, unit_bank.get(marks, []))
+        for marks, questions in unit_questions[unit].items()
+    }}
+    stored = sum(len(questions) for questions in fresh[unit].values())
+    if stored:
+        store_questions(fresh, syllabus)
+    logger.info("Refilled %s (%s): %s new questions.", unit, syllabus or 'web upload', stored)
+    return stored
+
+# Function: One Scan of the Bank
+def refill_pass(floor=REFILL_FLOOR, idle_seconds=REFILL_IDLE_SECONDS, cooldowns=None):
+    """
+    Refill the units with buckets below `floor`, most missing first, while Ollama stays
+    idle. `cooldowns` ({(syllabus, unit): time}) carries refill times between passes.
+    Returns the number of questions stored.
+    """
+    cooldowns = {} if cooldowns is None else cooldowns
+    bank = load_bank()
+    now = time.time()
+    low = []
+    for syllabus, unit, section in get_unit_sources():
+        deficits = bucket_deficits(bank.get((syllabus, unit), {}), floor)
+        if deficits and cooldowns.get((syllabus, unit), 0) + REFILL_COOLDOWN <= now:
+            low.append((sum(deficits.values()), syllabus, unit, section, deficits))
+    low.sort(key=lambda item: -item[0])
+
+    stored = 0
+    for done, (missing, syllabus, unit, section, deficits) in enumerate(low):
+        if not ollama_idle(idle_seconds):
+            logger.info("Ollama is busy; %s units left to refill.", len(low) - done)
+            break
+        cooldowns[syllabus, unit] = time.time()
+        logger.info("%s is %s questions below the floor of %s.", unit, missing, floor)
+        try:
+            stored += refill_unit(syllabus, unit, section, bank.get((syllabus, unit), {}), target_levels(deficits))
+        except (OllamaError, ValueError) as e:
+            logger.warning("Refill of %s failed: %s", unit, e)
+    return stored
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep the question bank's buckets above a floor in the background.")
+    parser.add_argument('--floor', type=int, default=REFILL_FLOOR, help="questions per (unit, marks, BT level) bucket")
+    parser.add_argument('--interval', type=float, default=REFILL_INTERVAL, help="seconds between scans")
+    parser.add_argument('--idle', type=float, default=REFILL_IDLE_SECONDS,
+                        help="seconds without a foreground generation before refilling")
+    parser.add_argument('--once', action='store_true', help="run a single pass and exit")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    init_db()
+    # This worker's own calls must not make Ollama look busy to itself
+    ollama_client.RECORD_ACTIVITY = False
+    cooldowns = {}
+    try:
+        while True:
+            refill_pass(args.floor, args.idle, cooldowns)
+            if args.once:
+                return 0
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
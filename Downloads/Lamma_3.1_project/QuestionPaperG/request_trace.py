@@ -0,0 +1,89 @@
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Per-request stage traces. metrics.observe_stage adds every timed stage to the trace of
+# the current request (a context variable, so it follows Flask threads and Quart tasks);
+# the app turns the trace into a Server-Timing header and one JSON log record.
+
+# Server-Timing descriptions, so devtools group stages as extraction / LLM / DB / render
+STAGE_GROUPS = {
+    'upload_save': 'extraction',
+    'extract_text': 'extraction',
+    'extract_units': 'extraction',
+    'ollama_first_token': 'LLM',
+    'ollama_total': 'LLM',
+    'parse': 'LLM',
+    'store_questions': 'DB',
+    'bank_read': 'DB',
+    'select_questions': 'selection',
+    'generate_pdf': 'render',
+    'render_wait': 'render',
+}
+
+# Incoming X-Request-Id values are reused only if they look like an id
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_current = contextvars.ContextVar('qp_request_trace', default=None)
+
+class RequestTrace:
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.stages = {}
+        # A request may fan work out to threads that share its trace
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = [
+            f'{stage};dur={seconds * 1000:.1f};desc="{STAGE_GROUPS.get(stage, stage)}"'
+            for stage, seconds in self.stages.items()
+        ]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+# Function: Start Tracing the Current Request
+def begin_trace(request_id=None):
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    trace = RequestTrace(request_id)
+    _current.set(trace)
+    return trace
+
+# Function: Add a Stage Timing to the Current Request (no-op outside a traced request)
+def record_stage(stage, seconds):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+# Function: Finish the Trace and Annotate the Response
+def finish_trace(response, method, path):
+    """
+    Set Server-Timing and X-Request-Id on `response` and log the trace as one JSON record.
+    """
+    trace = _current.get()
+    if trace is None:
+        return response
+    _current.set(None)
+    total = time.perf_counter() - trace.start
+    response.headers['Server-Timing'] = trace.server_timing(total)
+    response.headers['X-Request-Id'] = trace.request_id
+    logger.info("trace %s", json.dumps({
+        'request_id': trace.request_id,
+        'method': method,
+        'path': path,
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 1),
+        'stages_ms': {stage: round(seconds * 1000, 1) for stage, seconds in trace.stages.items()},
+    }))
+    return response
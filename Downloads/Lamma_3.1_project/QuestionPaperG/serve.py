@@ -0,0 +1,113 @@
+"""
+Production entry point: a prefork (gunicorn) server instead of app.run(debug=True).
+
+    python serve.py                          # app.py on 0.0.0.0:8000
+    python serve.py --app app1:app -w 8 -t 4
+
+async_app is an ASGI app and is served by hypercorn, not through this script:
+
+    hypercorn async_app:app --bind 0.0.0.0:8000 --workers 2
+
+hypercorn's workers are daemonic, so each renders PDFs in a thread pool instead of the
+render process pool (pdf_renderer.get_render_pool).
+
+The master process runs init_db() once before forking workers. Signals follow gunicorn:
+HUP reloads the configuration and replaces workers gracefully, TERM waits up to
+--graceful-timeout for in-flight requests, QUIT stops immediately. Every option can
+also be set through the QP_* environment variables below.
+
+Size --workers/--threads for a box with the load harness (python -m loadtest.run) against
+the stub LLM (python -m loadtest.stub_ollama); it reports where each endpoint saturates.
+Measured on 1 CPU with uploads left out of the mix (--mix generate_qp=8,download=4, so
+each figure is that endpoint's share of the mixed load), concurrency 1 to 8:
+
+    async_app, hypercorn --workers 1:  /generate-qp ~88-93 rps, /download ~48-50 rps
+    app1, python serve.py (1 worker):  /generate-qp ~112-122 rps, /download ~60-63 rps
+
+Both are flat from concurrency 1, i.e. CPU bound, so more workers than CPUs do not help.
+
+Every worker starts its own render pool. Unless QP_RENDER_WORKERS is set, it is sized
+so the workers' pools together have one process per CPU, instead of one per CPU each.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+from gunicorn.app.base import BaseApplication
+from database import init_db
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BIND = os.environ.get('QP_BIND', '0.0.0.0:8000')
+# One worker per CPU: rendering is CPU bound, and the threads of each worker cover the
+# requests waiting on the LLM
+DEFAULT_WORKERS = int(os.environ.get('QP_WORKERS', multiprocessing.cpu_count()))
+DEFAULT_THREADS = int(os.environ.get('QP_THREADS', 4))
+# Generation requests wait on the LLM for minutes; keep workers alive that long
+DEFAULT_TIMEOUT = int(os.environ.get('QP_TIMEOUT', 600))
+DEFAULT_GRACEFUL_TIMEOUT = int(os.environ.get('QP_GRACEFUL_TIMEOUT', 60))
+
+# Function: Render Processes per Worker
+def render_workers_per_worker(workers):
+    return max(1, multiprocessing.cpu_count() // max(1, workers))
+
+# Hook: Runs Once in the Master Before Any Worker Is Forked
+def on_starting(server):
+    init_db()
+    logger.info("Database initialized before forking workers.")
+
+class QuestionPaperServer(BaseApplication):
+    def __init__(self, app_uri, options):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+        self.cfg.set('on_starting', on_starting)
+
+    def load(self):
+        module_name, _, app_name = self.app_uri.partition(':')
+        module = __import__(module_name)
+        return getattr(module, app_name or 'app')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the question paper generator with prefork workers.")
+    parser.add_argument('--app', default=os.environ.get('QP_APP', 'app:app'), help="module:variable of a WSGI app (serve async_app with hypercorn, see above)")
+    parser.add_argument('-b', '--bind', default=DEFAULT_BIND)
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('-t', '--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('-k', '--worker-class', default=os.environ.get('QP_WORKER_CLASS', 'gthread'))
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--graceful-timeout', type=int, default=DEFAULT_GRACEFUL_TIMEOUT)
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('QP_MAX_REQUESTS', 0)),
+                        help="recycle a worker after this many requests (0 disables)")
+    parser.add_argument('--preload', action='store_true', default=os.environ.get('QP_PRELOAD') == '1',
+                        help="import the app in the master (less memory, but HUP no longer reloads code)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    # Read by pdf_renderer when each worker imports it, so set it before anything forks
+    if 'QP_RENDER_WORKERS' not in os.environ:
+        os.environ['QP_RENDER_WORKERS'] = str(render_workers_per_worker(args.workers))
+        logger.info("Render pool: %s processes in each of %s workers.", os.environ['QP_RENDER_WORKERS'], args.workers)
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': args.worker_class,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10 if args.max_requests else 0,
+        'preload_app': args.preload,
+    }
+    QuestionPaperServer(args.app, options).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import json
+import logging
+import re
+from question_pipeline import QUESTIONS_PER_UNIT
+from metrics import timed_stage, QUESTIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+BLOOM_LEVELS = [1, 2, 3, 4, 5, 6]
+# Characters that change the nesting or string state of a JSON document
+STRUCTURAL_PATTERN = re.compile(r'[{}\[\]"\\]')
+# Nesting depth of a unit object in {"units": [{...}, ...]}
+UNIT_DEPTH = 3
+
+# Function: JSON Schema of the Output of One Call (sent as Ollama's `format`)
+def build_output_schema(unit_ids, counts=QUESTIONS_PER_UNIT, bt_levels=None):
+    """
+    Constrain the answer to exactly the requested units, each with sum(counts) questions
+    whose marks and Bloom's level come from fixed sets. `bt_levels` ({marks: [levels]})
+    narrows the levels allowed for a marks value.
+    """
+    questions_per_unit = sum(counts.values())
+
+    def _question(marks_values, levels):
+        return {
+            'type': 'object',
+            'properties': {
+                'text': {'type': 'string'},
+                'marks': {'type': 'integer', 'enum': [int(marks) for marks in marks_values]},
+                'co': {'type': 'integer'},
+                'bt': {'type': 'integer', 'enum': list(levels)},
+            },
+            'required': ['text', 'marks', 'co', 'bt'],
+        }
+
+    if bt_levels:
+        question = {'anyOf': [_question([marks], bt_levels.get(marks, BLOOM_LEVELS)) for marks in counts]}
+    else:
+        question = _question(counts, BLOOM_LEVELS)
+    unit = {
+        'type': 'object',
+        'properties': {
+            'unit': {'type': 'string', 'enum': list(unit_ids)},
+            'questions': {'type': 'array', 'items': question,
+                          'minItems': questions_per_unit, 'maxItems': questions_per_unit},
+        },
+        'required': ['unit', 'questions'],
+    }
+    return {
+        'type': 'object',
+        'properties': {
+            'units': {'type': 'array', 'items': unit, 'minItems': len(unit_ids), 'maxItems': len(unit_ids)},
+        },
+        'required': ['units'],
+    }
+
+def _valid_question(question):
+    return (
+        isinstance(question, dict)
+        and isinstance(question.get('text'), str) and question['text'].strip()
+        and isinstance(question.get('marks'), int)
+        and isinstance(question.get('co'), int)
+        and question.get('bt') in BLOOM_LEVELS
+    )
+
+# Function: Check a Decoded Unit Object Against the Schema
+def valid_unit(unit):
+    """
+    The checks of build_output_schema that decoding relies on (types and Bloom's level);
+    unit ids, marks and counts are checked against the request in questions_from_units.
+    """
+    return (
+        isinstance(unit, dict)
+        and isinstance(unit.get('unit'), str)
+        and isinstance(unit.get('questions'), list)
+        and all(_valid_question(question) for question in unit['questions'])
+    )
+
+class UnitStreamDecoder:
+    """
+    Incremental decoder for streamed {"units": [...]} output: feed() the response chunks
+    as they arrive and each unit object is decoded and checked as soon as it closes, so a
+    truncated answer still yields its complete units.
+    """
+    def __init__(self):
+        self.units = []
+        self.invalid = 0
+        self.depth = 0
+        self.in_string = False
+        self.skip_at = None
+        self.pending = []
+
+    def feed(self, text):
+        start = 0 if self.depth >= UNIT_DEPTH else None
+        for match in STRUCTURAL_PATTERN.finditer(text):
+            char, pos = match.group(), match.start()
+            if pos == self.skip_at:
+                continue  # escaped character
+            if self.in_string:
+                if char == '\\':
+                    self.skip_at = pos + 1
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == UNIT_DEPTH:
+                    start = pos
+            else:
+                self.depth -= 1
+                if self.depth == UNIT_DEPTH - 1 and char == '}' and start is not None:
+                    self.pending.append(text[start:pos + 1])
+                    self._decode(''.join(self.pending))
+                    self.pending = []
+                    start = None
+        if start is not None:
+            self.pending.append(text[start:])
+        # An escape at the very end of a chunk applies to the first character of the next
+        self.skip_at = 0 if self.skip_at == len(text) else None
+
+    def _decode(self, unit_text):
+        try:
+            unit = json.loads(unit_text)
+        except ValueError:
+            unit = None
+        if valid_unit(unit):
+            self.units.append(unit)
+        else:
+            self.invalid += 1
+            logger.warning("Discarding a unit object that does not match the schema: %.200s", unit_text)
+
+# Function: Turn Decoded Unit Objects into the Question Bank Shape
+@timed_stage('parse')
+def questions_from_units(decoded_units, units, counts=QUESTIONS_PER_UNIT):
+    """
+    Map decoded unit objects to {title: {'4': [...], '6': [...]}} for the units in `units`,
+    keeping at most counts[marks] questions per marks value. The CO tag is always the
+    unit's number (the model's `co` is only checked).
+    """
+    unit_questions = {title: {marks: [] for marks in QUESTIONS_PER_UNIT} for title in units.values()}
+    for unit in decoded_units:
+        title = units.get(unit['unit'])
+        if title is None:
+            logger.warning("Unknown unit in the output: %s", unit['unit'])
+            continue
+        co_number = int(re.search(r'\d+', unit['unit']).group())
+        for question in unit['questions']:
+            marks = str(question['marks'])
+            if marks not in counts or len(unit_questions[title][marks]) >= counts[marks]:
+                logger.warning("Ignoring an extra or unexpected %s-mark question for %s.", marks, unit['unit'])
+                continue
+            if question['co'] != co_number:
+                logger.debug("CO %s given for %s; using CO %s.", question['co'], unit['unit'], co_number)
+            text = f"{question['text'].strip()} [CO:{co_number}] [BT:{question['bt']}]"
+            unit_questions[title][marks].append({'text': text, 'marks': marks})
+    QUESTIONS_TOTAL.inc('parsed', amount=sum(len(q) for marks_dict in unit_questions.values() for q in marks_dict.values()))
+    return unit_questions
@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+# The modules live flat in the QuestionPaperG directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+@pytest.fixture
+def bank_db(tmp_path, monkeypatch):
+    """
+    A fresh question database under a temporary working directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    database.init_db()
+    return database
+
+def make_unit_questions(units, per_marks=3, prefix='Q'):
+    return {
+        unit: {marks: [{'text': f'{prefix} {unit} {marks}-{i} [CO:1] [BT:2]', 'marks': marks} for i in range(per_marks)]
+               for marks in ('4', '6')}
+        for unit in units
+    }
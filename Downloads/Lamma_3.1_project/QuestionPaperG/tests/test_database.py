@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from conftest import make_unit_questions
+from database import replaced_questions_query
+from question_pipeline import select_questions
+
+SHARED_UNIT = 'Unit 1: Introduction'
+
+def bank_texts(bank):
+    return {question['text'] for buckets in bank.values() for questions in buckets.values() for question in questions}
+
+def test_bank_read_is_scoped_to_one_syllabus(bank_db):
+    bank_db.replace_questions(make_unit_questions([SHARED_UNIT], prefix='Physics'), syllabus='physics.pdf')
+    bank_db.replace_questions(make_unit_questions([SHARED_UNIT], prefix='History'), syllabus='history.pdf')
+    bank_db.replace_questions(make_unit_questions([SHARED_UNIT], prefix='Web'))
+
+    physics = bank_db.get_all_questions_by_unit('physics.pdf')
+    assert list(physics) == [SHARED_UNIT]
+    assert all(text.startswith('Physics') for text in bank_texts(physics))
+    assert len(physics[SHARED_UNIT]['4']) == 3
+    assert all(text.startswith('Web') for text in bank_texts(bank_db.get_all_questions_by_unit()))
+
+def test_select_questions_rejects_a_unit_outside_the_syllabus(bank_db):
+    bank_db.replace_questions(make_unit_questions(['Unit 1: Optics']), syllabus='physics.pdf')
+    spec = {'syllabus': 'physics.pdf', 'total_marks': 4,
+            'unit_details': [{'unit': 'Unit 2: Revolutions', 'questions': {'4': 1}}]}
+    unit_questions, error = select_questions(spec, bank_db.get_all_questions_by_unit(spec['syllabus']))
+    assert unit_questions is None
+    assert "'Unit 2: Revolutions'" in error and 'physics.pdf' in error
+
+def test_replaced_questions_query_is_scoped_to_one_syllabus():
+    assert replaced_questions_query(None) == ('DELETE FROM questions WHERE syllabus IS ?', [None])
+    sql, params = replaced_questions_query('physics.pdf', ['Unit 1', 'Unit 2'])
+    assert sql == 'DELETE FROM questions WHERE syllabus IS ? AND unit NOT IN (?, ?)'
+    assert params == ['physics.pdf', 'Unit 1', 'Unit 2']
+
+def test_web_upload_keeps_the_tagged_banks(bank_db):
+    sources = {SHARED_UNIT: 'Unit 1: Introduction\nTopics'}
+    bank_db.replace_questions(make_unit_questions([SHARED_UNIT], prefix='Physics'), syllabus='physics.pdf',
+                              sources=sources)
+    bank_db.replace_questions(make_unit_questions([SHARED_UNIT], prefix='Web'), sources=sources)
+    bank_db.replace_questions(make_unit_questions(['Unit 2: Review'], prefix='Web'), sources={},
+                              keep_units=[SHARED_UNIT])
+
+    assert all(text.startswith('Physics') for text in bank_texts(bank_db.get_all_questions_by_unit('physics.pdf')))
+    assert list(bank_db.get_all_questions_by_unit()) == [SHARED_UNIT, 'Unit 2: Review']
+    assert [syllabus for syllabus, _, _ in bank_db.get_unit_sources()] == ['physics.pdf']
+
+def test_async_web_upload_keeps_the_tagged_banks(bank_db):
+    async_database = pytest.importorskip('async_database')
+    bank_db.replace_questions(make_unit_questions([SHARED_UNIT], prefix='Physics'), syllabus='physics.pdf',
+                              sources={SHARED_UNIT: 'Unit 1: Introduction'})
+    asyncio.run(async_database.replace_questions(make_unit_questions([SHARED_UNIT], prefix='Web'), sources={}))
+
+    assert all(text.startswith('Physics') for text in bank_texts(bank_db.get_all_questions_by_unit('physics.pdf')))
+    assert [syllabus for syllabus, _, _ in bank_db.get_unit_sources()] == ['physics.pdf']
+
+def test_select_questions_favours_the_best_ranked_questions():
+    bank = make_unit_questions([SHARED_UNIT], per_marks=6)
+    spec = {'total_marks': 4, 'unit_details': [{'unit': SHARED_UNIT, 'questions': {'4': 1}}]}
+    picks = [select_questions(dict(spec, seed=seed), bank)[0][SHARED_UNIT][0] for seed in range(600)]
+    counts = [picks.count(question) for question in bank[SHARED_UNIT]['4']]
+    assert counts[0] > 3 * counts[-1] > 0
+    assert select_questions(dict(spec, seed=3), bank) == select_questions(dict(spec, seed=3), bank)
@@ -0,0 +1,34 @@
+import pytest
+import model_router
+from ollama_client import repair_calls
+from token_budget import plan_prompt
+
+def test_parse_routes_reads_models_in_order():
+    routes = model_router._parse_routes(' generate:4 = llama3.2:3b, llama3.1 ;repair=llama3.1;ignored')
+    assert routes == {'generate:4': ['llama3.2:3b', 'llama3.1'], 'repair': ['llama3.1']}
+
+def test_parse_routes_rejects_a_route_without_models():
+    with pytest.raises(ValueError, match="'generate:6'"):
+        model_router._parse_routes('generate:4=llama3.1;generate:6= , ')
+
+def test_repair_model_prefers_the_marks_route(monkeypatch):
+    monkeypatch.setattr(model_router, 'MODEL_ROUTES', {'generate': ['llama3.2'], 'repair': ['llama3.1'],
+                                                       'repair:6': ['qwen2.5']})
+    assert model_router.repair_model_for({'6': 3}) == 'qwen2.5'
+    assert model_router.repair_model_for({'4': 3}) == 'llama3.1'
+    monkeypatch.setattr(model_router, 'MODEL_ROUTES', {'generate': ['llama3.2']})
+    assert model_router.repair_model_for({'4': 3}) is None
+
+def test_repair_on_another_model_restarts_from_the_source_prompt():
+    units = {'1': 'Unit 1: Optics', '2': 'Unit 2: Waves'}
+    plan = plan_prompt(units, 'Unit 1: Optics\nLenses\nUnit 2: Waves\nSound', 'llama3.2')
+    sources = dict.fromkeys(units, plan.calls[0])
+    contexts = dict.fromkeys(units, [1, 2, 3])
+    unit_questions = {'Unit 1: Optics': {marks: [] for marks in plan.counts}}
+
+    (call, context), = repair_calls(plan, units, unit_questions, contexts, sources, 'llama3.1')
+    assert context is None and call.units == ['1']
+    assert call.prompt.startswith(plan.calls[0].prompt)
+
+    (call, context), = repair_calls(plan, units, unit_questions, contexts, sources, plan.model)
+    assert context == [1, 2, 3] and call.units == ['1']
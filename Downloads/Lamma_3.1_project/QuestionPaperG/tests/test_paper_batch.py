@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from conftest import make_unit_questions
+from paper_batch import build_buckets, draw_candidates, generate_paper_batch, max_pairwise_overlap
+
+UNITS = [f'Unit {unit}' for unit in range(1, 5)]
+
+@pytest.mark.parametrize('num_papers, max_overlap', [(3, 0), (5, 1), (10, 3)])
+def test_papers_share_at_most_max_overlap_questions(num_papers, max_overlap):
+    bank = make_unit_questions(UNITS, per_marks=6)
+    papers = generate_paper_batch(bank, num_papers=num_papers, max_overlap=max_overlap, seed=7)
+    assert len(papers) == num_papers
+    assert max_pairwise_overlap(papers) <= max_overlap
+    for paper in papers:
+        assert all(len(paper[unit]['4']) == 1 and len(paper[unit]['6']) == 1 for unit in UNITS)
+
+def test_an_impossible_overlap_bound_is_reported():
+    # Two questions per bucket cannot give three papers that share nothing
+    bank = make_unit_questions(UNITS, per_marks=2)
+    with pytest.raises(ValueError, match='Could only build'):
+        generate_paper_batch(bank, num_papers=3, max_overlap=0, seed=7, max_rounds=5)
+
+def test_candidates_favour_the_best_ranked_questions():
+    buckets, total_questions = build_buckets(make_unit_questions(UNITS[:1], per_marks=6), {'4': 1})
+    counts = draw_candidates(np.random.default_rng(7), buckets, total_questions, 2000).sum(axis=0)
+    assert list(counts) == sorted(counts, reverse=True)
+    assert counts[0] > 3 * counts[-1] > 0
@@ -0,0 +1,42 @@
+import os
+import pytest
+import pdf_cache
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_cache, 'PDF_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(pdf_cache, '_cache_size', None)
+    return tmp_path
+
+def add_entry(cache_dir, name, size, age):
+    path = cache_dir / f'{name}.pdf'
+    path.write_bytes(b'x' * size)
+    os.utime(path, (1000 - age, 1000 - age))
+    return path
+
+def test_eviction_removes_least_recently_used_down_to_the_low_water_mark(cache_dir):
+    paths = [add_entry(cache_dir, name, 100, age) for name, age in [('old', 30), ('middle', 20), ('new', 10)]]
+    (cache_dir / 'notes.txt').write_bytes(b'x' * 1000)
+
+    # 300 bytes over a 210-byte quota trim to 189 (EVICT_LOW_WATER), not just to 210
+    assert pdf_cache.evict_pdf_cache(quota_bytes=210) == 2
+    assert [path.exists() for path in paths] == [False, False, True]
+    assert (cache_dir / 'notes.txt').exists()
+    assert pdf_cache._cache_size == 100
+
+def test_a_cache_under_its_quota_is_left_alone(cache_dir):
+    add_entry(cache_dir, 'only', 100, 10)
+    assert pdf_cache.evict_pdf_cache(quota_bytes=100) == 0
+    assert pdf_cache._cache_size == 100
+
+def test_a_cache_hit_counts_as_recent_use(cache_dir):
+    old = add_entry(cache_dir, 'old', 100, 30)
+    new = add_entry(cache_dir, 'new', 100, 10)
+    assert pdf_cache.get_cached_pdf('old') == str(old)
+
+    assert pdf_cache.evict_pdf_cache(quota_bytes=150) == 1
+    assert old.exists() and not new.exists()
+
+def test_a_missing_cache_directory_evicts_nothing(cache_dir, monkeypatch):
+    monkeypatch.setattr(pdf_cache, 'PDF_CACHE_DIR', str(cache_dir / 'missing'))
+    assert pdf_cache.evict_pdf_cache(quota_bytes=0) == 0
@@ -0,0 +1,32 @@
+import json
+import pytest
+from structured_output import UnitStreamDecoder
+
+UNITS = [
+    {'unit': 'Unit 1', 'questions': [{'text': 'Define "focal length" {f}.', 'marks': 4, 'co': 1, 'bt': 1}]},
+    {'unit': 'Unit 2', 'questions': [{'text': 'Derive the wave equation \\ [x].', 'marks': 6, 'co': 2, 'bt': 3}]},
+]
+
+def feed_chunks(text, size):
+    decoder = UnitStreamDecoder()
+    for i in range(0, len(text), size):
+        decoder.feed(text[i:i + size])
+    return decoder
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 7, 1000])
+def test_chunk_boundaries_do_not_change_the_decoded_units(size):
+    # Quotes, escapes and brackets inside the question text fall on every chunk boundary at size 1
+    decoder = feed_chunks(json.dumps({'units': UNITS}), size)
+    assert decoder.units == UNITS
+    assert decoder.invalid == 0
+
+def test_a_truncated_answer_keeps_its_complete_units():
+    text = json.dumps({'units': UNITS})
+    decoder = feed_chunks(text[:text.index('Unit 2') + 20], 5)
+    assert decoder.units == UNITS[:1]
+
+def test_a_unit_outside_the_schema_is_counted_and_skipped():
+    bad = {'unit': 'Unit 3', 'questions': [{'text': 'Explain.', 'marks': 4, 'co': 3, 'bt': 9}]}
+    decoder = feed_chunks(json.dumps({'units': [bad] + UNITS}), 3)
+    assert decoder.units == UNITS
+    assert decoder.invalid == 1
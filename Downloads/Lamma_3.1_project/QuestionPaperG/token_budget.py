@@ -0,0 +1,169 @@
+import logging
+import math
+import os
+import re
+from collections import namedtuple
+from question_pipeline import build_prompt, build_system_prompt, get_unit_index, requested_counts, QUESTIONS_PER_UNIT
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a token in characters for English syllabus text (compare with the
+# prompt_eval_count column of generation_stats to tune it)
+CHARS_PER_TOKEN = float(os.environ.get('QP_CHARS_PER_TOKEN', 4.0))
+
+# Context window requested per model (sent as options.num_ctx), overridable with
+# QP_MODEL_NUM_CTX="model=tokens,..."
+MODEL_NUM_CTX = {
+    'llama3.1': 8192,
+    'llama3.2': 8192,
+    'llama3.2-vision': 8192,
+}
+DEFAULT_NUM_CTX = int(os.environ.get('QP_DEFAULT_NUM_CTX', 4096))
+
+# Output reserved per question with its tags (the unit heading is included in the first)
+OUTPUT_TOKENS_PER_QUESTION = 50
+
+BLANK_RUNS_PATTERN = re.compile(r'\n\s*\n+')
+SPACE_RUNS_PATTERN = re.compile(r'[^\S\n]+')
+
+# One Ollama call of a plan: the units it covers and its estimated sizes (prompt_tokens
+# includes the system prompt, i.e. what a call without a previous context evaluates)
+PlannedCall = namedtuple('PlannedCall', 'units prompt prompt_tokens output_tokens')
+# How a generation is split: 'full', 'trimmed', 'trimmed_no_reference', 'per_unit' or 'per_unit_condensed';
+# counts are the questions per unit by marks it needs, requested the candidates it asks for,
+# bt_levels the Bloom's levels allowed per marks (None allows all)
+PromptPlan = namedtuple('PromptPlan', 'strategy model num_ctx system counts requested bt_levels calls')
+
+def _parse_num_ctx(spec):
+    overrides = {}
+    for item in spec.split(','):
+        if '=' in item:
+            model, tokens = item.split('=', 1)
+            overrides[model.strip()] = int(tokens)
+    return overrides
+
+MODEL_NUM_CTX.update(_parse_num_ctx(os.environ.get('QP_MODEL_NUM_CTX', '')))
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def num_ctx_for(model):
+    return MODEL_NUM_CTX.get(model, DEFAULT_NUM_CTX)
+
+# Function: Drop Boilerplate from Syllabus Text
+def trim_syllabus_text(syllabus_text):
+    """
+    Remove the preamble before the first unit heading and collapse blank lines and
+    runs of spaces, which PDF extraction produces a lot of.
+    """
+    spans = get_unit_index(syllabus_text)
+    if spans:
+        syllabus_text = syllabus_text[spans[0].start_offset:]
+    return collapse_whitespace(syllabus_text)
+
+def collapse_whitespace(text):
+    return BLANK_RUNS_PATTERN.sub('\n', SPACE_RUNS_PATTERN.sub(' ', text)).strip()
+
+# Function: Cut Text to a Token Budget at Line Boundaries
+def condense_text(text, max_tokens):
+    """
+    Keep whole lines from the start of `text` while they fit in `max_tokens`
+    (a unit's heading and first topics carry most of its content).
+    """
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line + '\n')
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return '\n'.join(kept)
+
+def planned_call(units, prompt, system, counts):
+    output_tokens = OUTPUT_TOKENS_PER_QUESTION * sum(counts.values()) * len(units)
+    return PlannedCall(list(units), prompt, estimate_tokens(system) + estimate_tokens(prompt), output_tokens)
+
+def _fits(call, num_ctx):
+    return call.prompt_tokens + call.output_tokens <= num_ctx
+
+# Function: Unit Sections of the Text
+def unit_sections(units, syllabus_text):
+    """
+    Map each unit id in `units` to the text of its section (heading included).
+    """
+    sections = {}
+    for span in get_unit_index(syllabus_text):
+        # extract_units_from_text keeps the last heading of a repeated unit id
+        if units.get(span.unit_id) == span.title:
+            sections[span.unit_id] = syllabus_text[span.start_offset:span.end_offset]
+    return sections
+
+def sections_by_title(units, syllabus_text):
+    # Keyed like the question bank (unit titles), for database.replace_questions(sources=...)
+    return {units[unit_id]: section for unit_id, section in unit_sections(units, syllabus_text).items()}
+
+# Function: Plan Prompts That Fit the Model Context
+def plan_prompt(units, syllabus_text, model, reference_text=None, counts=QUESTIONS_PER_UNIT, bt_levels=None):
+    """
+    Pick the cheapest way to fit the generation into the model's num_ctx:
+    the full prompt, the prompt with boilerplate trimmed (then without reference
+    material), one call per unit, or one call per unit with its section condensed.
+    """
+    num_ctx = num_ctx_for(model)
+    requested = requested_counts(counts)
+    system = build_system_prompt(requested)
+
+    def _call(call_units, text, reference=None):
+        return planned_call(call_units, build_prompt(call_units, text, reference), system, requested)
+
+    trimmed_text = trim_syllabus_text(syllabus_text)
+    trimmed_reference = collapse_whitespace(reference_text) if reference_text else None
+
+    candidates = [('full', syllabus_text, reference_text), ('trimmed', trimmed_text, trimmed_reference)]
+    if reference_text:
+        candidates.append(('trimmed_no_reference', trimmed_text, None))
+    for strategy, text, reference in candidates:
+        call = _call(units, text, reference)
+        if _fits(call, num_ctx):
+            return _log_plan(PromptPlan(strategy, model, num_ctx, system, counts, requested, bt_levels, [call]))
+
+    sections = unit_sections(units, syllabus_text)
+    calls = [_call({unit_id: title}, collapse_whitespace(sections.get(unit_id, title)))
+             for unit_id, title in units.items()]
+    if all(_fits(call, num_ctx) for call in calls):
+        return _log_plan(PromptPlan('per_unit', model, num_ctx, system, counts, requested, bt_levels, calls))
+
+    condensed = []
+    for call in calls:
+        if not _fits(call, num_ctx):
+            unit_id = call.units[0]
+            overhead = _call({unit_id: units[unit_id]}, '').prompt_tokens
+            budget = num_ctx - overhead - call.output_tokens
+            if budget <= 0:
+                raise ValueError(f"The context window of {model} ({num_ctx} tokens) is too small for the prompt.")
+            call = _call({unit_id: units[unit_id]}, condense_text(collapse_whitespace(sections.get(unit_id, '')), budget))
+        condensed.append(call)
+    return _log_plan(PromptPlan('per_unit_condensed', model, num_ctx, system, counts, requested, bt_levels, condensed))
+
+def describe_plan(plan):
+    return {
+        'strategy': plan.strategy,
+        'model': plan.model,
+        'num_ctx': plan.num_ctx,
+        'marks': list(plan.counts),
+        'requested': plan.requested,
+        'system_tokens': estimate_tokens(plan.system),
+        'calls': [
+            {'units': call.units, 'prompt_tokens': call.prompt_tokens, 'output_tokens': call.output_tokens}
+            for call in plan.calls
+        ],
+    }
+
+def _log_plan(plan):
+    logger.info(
+        "Prompt plan for %s: %s, %s call(s), prompt tokens %s of num_ctx %s.",
+        plan.model, plan.strategy, len(plan.calls),
+        [call.prompt_tokens for call in plan.calls], plan.num_ctx
+    )
+    return plan
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from collections import namedtuple
+from database import section_hash, get_unit_hashes
+from token_budget import sections_by_title
+from model_router import route_unit_questions, aroute_unit_questions
+
+logger = logging.getLogger(__name__)
+
+# Outcome of generating an uploaded syllabus against the bank: questions of the changed and
+# new units, their prompt plans, every unit's section (for replace_questions' sources) and
+# the units whose banked questions are kept (for its keep_units)
+Revision = namedtuple('Revision', 'unit_questions plans sources unchanged')
+
+# Function: Split the Units of an Upload into Changed and Unchanged
+def plan_revision(units, sources, stored_hashes):
+    """
+    Return (changed {unit_id: title}, unchanged [title]). A unit is unchanged when its
+    section hashes the same as the stored one (which only exists while it has questions);
+    a unit whose section was not found is always regenerated.
+    """
+    changed = {}
+    unchanged = []
+    for unit_id, title in units.items():
+        section = sources.get(title)
+        if section is not None and stored_hashes.get(title) == section_hash(section):
+            unchanged.append(title)
+        else:
+            changed[unit_id] = title
+    logger.info("Revision: %s units changed or new, %s unchanged.", len(changed), len(unchanged))
+    return changed, unchanged
+
+def revision_text(changed, sources, syllabus_text):
+    # Only the changed units' sections are sent, so a revision's prompt grows with the change
+    sections = [sources.get(title) for title in changed.values()]
+    return syllabus_text if None in sections else '\n\n'.join(sections)
+
+# Function: Generate Only the Units That Changed Since the Last Upload (blocking)
+def revise_unit_questions(units, syllabus_text, bank_syllabus=None, reference_text=None, syllabus=None, models=None):
+    """
+    Compare every unit's section with the one stored for `bank_syllabus` (the untagged
+    bank when None) and generate only the changed and new units. Store the result with
+    replace_questions(revision.unit_questions, bank_syllabus, revision.sources, revision.unchanged).
+    """
+    sources = sections_by_title(units, syllabus_text)
+    changed, unchanged = plan_revision(units, sources, get_unit_hashes(bank_syllabus))
+    if not changed:
+        return Revision({}, [], sources, unchanged)
+    unit_questions, plans = route_unit_questions(
+        changed, revision_text(changed, sources, syllabus_text), reference_text, syllabus=syllabus, models=models
+    )
+    return Revision(unit_questions, plans, sources, unchanged)
+
+# Function: Generate Only the Units That Changed Since the Last Upload (asyncio)
+async def arevise_unit_questions(client, units, syllabus_text, bank_syllabus=None, reference_text=None,
+                                 syllabus=None, models=None):
+    sources = sections_by_title(units, syllabus_text)
+    stored_hashes = await asyncio.to_thread(get_unit_hashes, bank_syllabus)
+    changed, unchanged = plan_revision(units, sources, stored_hashes)
+    if not changed:
+        return Revision({}, [], sources, unchanged)
+    unit_questions, plans = await aroute_unit_questions(
+        client, changed, revision_text(changed, sources, syllabus_text), reference_text, syllabus=syllabus, models=models
+    )
+    return Revision(unit_questions, plans, sources, unchanged)